@@ -11,13 +11,16 @@ import utils
 @click.command()
 @click.option('-a', '--algorithm', type=click.STRING, default='PSO')
 @click.option('-d', '--dimension', type=click.STRING, default='d10')
-def main(algorithm: str, dimension: str) -> None:
+@click.option('-j', '--n-jobs', type=click.INT, default=-1, help='Number of worker processes (-1: all CPUs).')
+@click.option('--no-cache', is_flag=True, help='Recompute the summary statistics instead of reading cached ones.')
+@click.option('-m', '--memory-budget', type=click.FLOAT, default=None,
+              help='Summarise the runs one function at a time, keeping at most this many GiB of values for the '
+                   'summaries over all functions (default: load all runs at once).')
+def main(algorithm: str, dimension: str, n_jobs: int, no_cache: bool, memory_budget: float) -> None:
     dataset = f'{algorithm}_{dimension}'
     base_path = Path(__file__).parent
     save_directory = (Path(base_path / 'data')).resolve()
     print(save_directory)
-    df = pd.read_feather(save_directory / f'dataframes/{dataset}_full.feather')
-    print(df.head())
     experiment_directory = save_directory / f'analysis/{dataset}/'
     pathlib.Path.mkdir(experiment_directory, parents=True, exist_ok=True)
 
@@ -28,106 +31,128 @@ def main(algorithm: str, dimension: str) -> None:
     div_std_columns = ['DistanceToOptimum_std',
                        'MinimumIndividualDistance_std']
 
-    # Summary statistics of process data, summarised over all
-    df_process_stats_all = utils.summarise_process_stats(df,
-                                                         ['Algorithm'],
-                                                         value_columns,
-                                                         'Evaluations',
-                                                         None,
-                                                         dataset,
-                                                         'all',
-                                                         experiment_directory)
-
-    # Summary statistics of final values, summarised over all
-    df_final_stats_all = utils.summarise_final_stats(df,
-                                                     ['Algorithm'],
-                                                     ['FinalDistance', 'AOCC'],
-                                                     None,
-                                                     dataset,
-                                                     'all',
-                                                     experiment_directory)
-
-    utils.plot_summarised_lineplots(df_process_stats_all,
-                                    value_columns=mean_columns,
-                                    hue='Algorithm',
-                                    dataset=dataset,
-                                    config_name='all_process', save_directory=experiment_directory)
-
-    utils.plot_diversity_summarised(df_process_stats_all, mean_columns, div_std_columns, dataset,
-                                    f'{dataset}_all_diversity',
-                                    experiment_directory)
-
-    del df_process_stats_all, df_final_stats_all
+    # Only load the columns needed for the analysis
+    runs_directory = save_directory / 'dataframes/runs'
+    run_filter = {'Algorithm': algorithm, 'Dimension': dimension}
+    columns = ['Algorithm', 'Function', 'Instance', 'Run', 'Iterations', 'Evaluations', 'FinalDistance',
+               'AOCC'] + value_columns
+    loaded = {}
+
+    def load_runs() -> pd.DataFrame:
+        if 'df' not in loaded:
+            with utils.stage('load runs') as stage:
+                loaded['df'] = utils.load_dataset(runs_directory, run_filter, columns)
+                stage.rows = len(loaded['df'])
+            print(loaded['df'].head())
+        return loaded['df']
+
+    # Summary statistics over all, by function and by instance, computed in one pass; the runs are only loaded if
+    # the summaries of the current runs are not cached yet
+    cache = None if no_cache else utils.SummaryCache(save_directory / 'cache/summaries')
+    fingerprint = utils.dataset_fingerprint(runs_directory, run_filter)
+    levels = [['Algorithm'], ['Function'], ['Function', 'Instance']]
+    if memory_budget is None:
+        with utils.stage('summarise process stats') as stage:
+            process_stats = utils.summarise_process_stats_levels(load_runs, levels, value_columns, 'Evaluations',
+                                                                 ['Algorithm'], cache, fingerprint)
+            stage.rows = sum(len(stats) for stats in process_stats)
+        with utils.stage('summarise final stats') as stage:
+            final_stats = utils.summarise_final_stats_levels(load_runs, levels, ['FinalDistance', 'AOCC'],
+                                                             ['Algorithm'], cache, fingerprint)
+            stage.rows = sum(len(stats) for stats in final_stats)
+        loaded.clear()
+    else:
+        # Streaming mode: only the runs of one function are in memory at once
+        functions = sorted(path.name.split('=')[1] for path in
+                           (runs_directory / f'Algorithm={algorithm}/Dimension={dimension}').glob('Function=*'))
+        with utils.stage('summarise by partition') as stage:
+            process_stats, final_stats = utils.summarise_stats_by_partition(
+                lambda f, partition_columns: utils.load_dataset(runs_directory, {**run_filter, 'Function': f},
+                                                                partition_columns or columns),
+                functions, 'Function', levels, value_columns, ['FinalDistance', 'AOCC'], 'Evaluations',
+                ['Algorithm'], int(memory_budget * 2 ** 30), cache, fingerprint)
+            stage.rows = sum(len(stats) for stats in process_stats + final_stats)
+    df_process_stats_all, df_function_process_stats, df_instance_process_stats = process_stats
+    df_final_stats_all, df_function_stats, df_instance_stats = final_stats
+    del process_stats, final_stats
+
+    # Summary store of all algorithms per dimension, used by the comparison
+    store_directory = save_directory / 'dataframes/summaries'
+    with utils.stage('save to summary store'):
+        for level, process_stats, final_stats in [('all', df_process_stats_all, df_final_stats_all),
+                                                  ('functions', df_function_process_stats, df_function_stats),
+                                                  ('instances', df_instance_process_stats, df_instance_stats)]:
+            utils.save_to_summary_store(process_stats, store_directory, f'{level}_process_summaries', dimension,
+                                        algorithm)
+            utils.save_to_summary_store(final_stats, store_directory, f'{level}_summaries', dimension, algorithm)
+
+    # Summary statistics of process data and final values, summarised over all
+    utils.save_process_summaries(df_process_stats_all, dataset, 'all', experiment_directory)
+    utils.save_final_summaries(df_final_stats_all, dataset, 'all', experiment_directory)
+
+    # Plots are independent work units, rendered by a pool of worker processes
+    render_queue = utils.RenderQueue()
+    render_queue.add(utils.plot_summarised_lineplots, df_process_stats_all,
+                     value_columns=mean_columns,
+                     hue='Algorithm',
+                     dataset=dataset,
+                     config_name='all_process', save_directory=experiment_directory)
+
+    render_queue.add(utils.plot_diversity_summarised, df_process_stats_all, mean_columns, div_std_columns, dataset,
+                     f'{dataset}_all_diversity',
+                     experiment_directory)
 
     # Problem-dependent analysis
 
-    # Summary statistics of process data, summarised by function
-    df_function_process_stats = utils.summarise_process_stats(df,
-                                                              ['Function'],
-                                                              value_columns,
-                                                              'Evaluations',
-                                                              ['Algorithm'],
-                                                              dataset,
-                                                              f'functions',
-                                                              experiment_directory)
-
-    # Summary statistics of final values, summarised by function
-    df_function_stats = utils.summarise_final_stats(df,
-                                                    ['Function'],
-                                                    ['FinalDistance', 'AOCC'],
-                                                    ['Algorithm'],
-                                                    dataset,
-                                                    f'functions',
-                                                    experiment_directory)
-
-    utils.plot_summarised_lineplots(df_function_process_stats,
-                                    value_columns=mean_columns,
-                                    hue='Function',
-                                    dataset=dataset,
-                                    config_name='function_process', save_directory=experiment_directory)
-
-    group_param_dfs = [y for x, y in df_function_process_stats.groupby('Function', observed=False)]
-    for group_param_df in group_param_dfs:
-        value = group_param_df['Function'].iloc[0]
-        utils.plot_diversity_summarised(group_param_df, mean_columns, div_std_columns, dataset,
-                                        f'{dataset}_{value}', experiment_directory)
-
-    function_dfs = [y for x, y in df.groupby('Function', observed=False)]
-    for function_df in function_dfs:
-        f = function_df['Function'].iloc[0]
-        # Summary statistics of process data, summarised by instance
-        df_instance_process_stats = utils.summarise_process_stats(function_df,
-                                                                  ['Instance'],
-                                                                  value_columns,
-                                                                  'Evaluations',
-                                                                  ['Algorithm'],
-                                                                  dataset,
-                                                                  f'{f}_instances',
-                                                                  experiment_directory)
-
-        # Summary statistics of final values, summarised by instance
-        df_instance_stats = utils.summarise_final_stats(function_df,
-                                                        ['Instance'],
-                                                        ['FinalDistance', 'AOCC'],
-                                                        ['Algorithm'],
-                                                        dataset,
-                                                        f'{f}_instances',
-                                                        experiment_directory)
-
-        utils.plot_summarised_lineplots(df_instance_process_stats,
-                                        value_columns=mean_columns,
-                                        hue='Instance',
-                                        dataset=dataset,
-                                        config_name=f'{f}_instance_process', save_directory=experiment_directory)
-
-        instance_dfs = [y for x, y in function_df.groupby('Instance', observed=False)]
-        for instance_df in instance_dfs:
-            i = instance_df['Instance'].iloc[0]
-            utils.plot_descriptive_individual_run(instance_df, value_columns=value_columns, hue='Run', style=None,
-                                                  algorithm=algorithm, dataset=dataset,
-                                                  config_name=f'{dataset}_{f}_{i}', save_directory=experiment_directory)
-
-    del function_dfs, instance_dfs, df_function_process_stats, df_function_stats, df_instance_process_stats
+    # Summary statistics of process data and final values, summarised by function
+    utils.save_process_summaries(df_function_process_stats, dataset, 'functions', experiment_directory)
+    utils.save_final_summaries(df_function_stats, dataset, 'functions', experiment_directory)
+
+    render_queue.add(utils.plot_summarised_lineplots, df_function_process_stats,
+                     value_columns=mean_columns,
+                     hue='Function',
+                     dataset=dataset,
+                     config_name='function_process', save_directory=experiment_directory)
+
+    for f, group_param_df in df_function_process_stats.groupby('Function', observed=True):
+        render_queue.add(utils.plot_diversity_summarised, group_param_df, mean_columns, div_std_columns, dataset,
+                         f'{dataset}_{f}', experiment_directory)
+
+    for f, instances in df_instance_stats.groupby('Function', observed=True)['Instance'].unique().items():
+        # Summary statistics of process data and final values, summarised by instance
+        instance_process_stats = (df_instance_process_stats[df_instance_process_stats['Function'] == f]
+                                  .drop(columns='Function').reset_index(drop=True))
+        instance_stats = (df_instance_stats[df_instance_stats['Function'] == f]
+                          .drop(columns='Function').reset_index(drop=True))
+        utils.save_process_summaries(instance_process_stats, dataset, f'{f}_instances', experiment_directory)
+        utils.save_final_summaries(instance_stats, dataset, f'{f}_instances', experiment_directory)
+
+        render_queue.add(utils.plot_summarised_lineplots, instance_process_stats,
+                         value_columns=mean_columns,
+                         hue='Instance',
+                         dataset=dataset,
+                         config_name=f'{f}_instance_process', save_directory=experiment_directory)
+
+        # Workers load only the runs of their instance
+        for i in sorted(instances):
+            render_queue.add(plot_instance_runs, runs_directory, {**run_filter, 'Function': f, 'Instance': i},
+                             ['Run', 'Evaluations'] + value_columns, algorithm, dataset, f'{dataset}_{f}_{i}',
+                             experiment_directory)
+
+    del df_process_stats_all, df_final_stats_all, df_function_process_stats, df_function_stats, \
+        df_instance_process_stats, df_instance_stats
+
+    with utils.stage('render plots', rows=len(render_queue.specs)):
+        render_queue.render(n_jobs)
+
+
+def plot_instance_runs(runs_directory: Path, run_filter: dict, columns: list, algorithm: str, dataset: str,
+                       config_name: str, save_directory: Path) -> None:
+    """Load the runs selected by `run_filter` and plot them individually."""
+    instance_df = utils.load_dataset(runs_directory, run_filter, columns)
+    utils.plot_descriptive_individual_run(instance_df, value_columns=columns[2:], hue='Run', style=None,
+                                          algorithm=algorithm, dataset=dataset,
+                                          config_name=config_name, save_directory=save_directory)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""
+Generator of synthetic .cbor logs in the layout of the exploration-mechanisms experiments (a map of the logged
+`names` and the `entries`, each mapping name indices to values), for benchmarking without the real logs.
+"""
+import sys
+from pathlib import Path
+
+import cbor2 as cb
+import click
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import utils  # noqa: E402
+
+# Logged names, in the order of the real logs
+log_names = [
+    'mahf::state::common::Iterations',
+    'mahf::state::common::Evaluations',
+    'BestObjectiveValue',
+    'mahf::components::measures::diversity::MinimumIndividualDistance',
+]
+
+# Values of the algorithm parameters in the config names (as used in the experiments)
+parameter_values = {
+    'InertiaWeight': '0.7',
+    'C1': '1.5',
+    'C2': '1.5',
+    'YValue': '0.1',
+    'PMin': '0.05',
+    'ArchiveSize': '100',
+    'HistorySize': '10',
+    'FValue': '0.5',
+    'Crossover': '0.5',
+    'Threshold': '0.1',
+    'ThresholdParameter': 'Div',
+    'NewPopulationSize': '20',
+    'Mu': '0.5',
+    'ReferenceSolution': 'Best',
+    'Replacement': 'Worst',
+}
+
+bbob_functions = [f'f{i:03d}' for i in range(1, 25)]
+bbob_instances = [f'i{i:02d}' for i in range(1, 6)]
+
+
+def generate_logs(directory, algorithm: str = 'PSO', dimension: str = 'd10', runs: int = 10, steps: int = 100,
+                  functions: list = None, instances: list = None, population_size: int = 20, extra_fields: int = 0,
+                  seed: int = 0) -> list:
+    """
+    Write one synthetic log per run, function and instance to `directory`, named like the real logs
+    (e.g. '1_bbob_f001_i01_d10_20_0.7_1.5_1.5.cbor'). The best objective value decreases towards the optimum of the
+    function instance (see datasets/bbob_optima.csv), so the distances to the optimum are positive.
+
+    :param directory: Directory of the logs (created if missing).
+    :param algorithm: Algorithm whose parameters are added to the names (see `utils.algorithm_schemas`).
+    :param dimension: Dimension, e.g. 'd10'.
+    :param runs: Number of runs per function instance.
+    :param steps: Number of logged steps per run.
+    :param functions: BBOB functions, defaults to all 24.
+    :param instances: BBOB instances, defaults to the first 5.
+    :param population_size: Population size (evaluations per iteration).
+    :param extra_fields: Number of additional logged values per entry that the analysis does not read.
+    :param seed: Seed of the random values.
+    :return: List of the paths of the written logs.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    optima = utils.read_optima(Path(__file__).resolve().parents[1] / 'datasets/bbob_optima.csv')
+    parameters = [parameter_values[label] for label in utils.algorithm_schemas[algorithm]]
+    names = log_names + [f'Extra{i}' for i in range(extra_fields)]
+    rng = np.random.default_rng(seed)
+
+    paths = []
+    for function in functions or bbob_functions:
+        for instance in instances or bbob_instances:
+            optimum = optima.get((function, instance, dimension), 0.0)
+            for run in range(1, runs + 1):
+                iterations = np.arange(steps)
+                evaluations = (iterations + 1) * population_size
+                # improvements at random steps, decaying over the run, towards a final distance between 1e-8 and 10
+                improvements = rng.exponential(1.0, steps) * (rng.random(steps) < 0.3) * np.exp(-5 * iterations / steps)
+                best = optimum + 10 ** rng.uniform(-8, 1) + 100 * rng.random() * np.cumsum(improvements[::-1])[::-1]
+                diversity = rng.random() * np.exp(-3 * iterations / steps) + 1e-3 * rng.random(steps)
+                values = [iterations.tolist(), evaluations.tolist(), best.tolist(), diversity.tolist()] + \
+                    [rng.random(steps).tolist() for _ in range(extra_fields)]
+                entries = [dict(enumerate(entry)) for entry in zip(*values)]
+
+                name = '_'.join([str(run), 'bbob', function, instance, dimension, str(population_size)] + parameters)
+                path = directory / f'{name}.cbor'
+                with path.open('wb') as fp:
+                    cb.dump({'names': names, 'entries': entries}, fp)
+                paths.append(path)
+    return paths
+
+
+@click.command()
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('-a', '--algorithms', type=click.STRING, multiple=True, default=['PSO'], show_default=True)
+@click.option('-d', '--dimensions', type=click.STRING, multiple=True, default=['d10'], show_default=True)
+@click.option('-r', '--runs', type=click.INT, default=10, show_default=True)
+@click.option('-s', '--steps', type=click.INT, default=100, show_default=True)
+@click.option('-f', '--functions', type=click.INT, default=24, show_default=True, help='Number of BBOB functions.')
+@click.option('-i', '--instances', type=click.INT, default=5, show_default=True, help='Number of BBOB instances.')
+@click.option('--seed', type=click.INT, default=0, show_default=True)
+def main(directory: str, algorithms: tuple, dimensions: tuple, runs: int, steps: int, functions: int, instances: int,
+         seed: int) -> None:
+    """
+    Writes synthetic logs to DIRECTORY/<algorithm>/<dimension>, the layout of the data directory of the
+    exploration-mechanisms repository.
+    """
+    for k, (algorithm, dimension) in enumerate((a, d) for a in algorithms for d in dimensions):
+        paths = generate_logs(Path(directory) / algorithm / dimension, algorithm, dimension, runs, steps,
+                              bbob_functions[:functions], bbob_instances[:instances], seed=seed + k)
+        print(f'{len(paths)} logs of {algorithm} {dimension}')
+
+
+if __name__ == '__main__':
+    main()
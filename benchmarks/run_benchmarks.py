@@ -0,0 +1,262 @@
+"""
+Benchmarks of the steps of the analysis on synthetic logs (see `generate_logs.py`): reading the logs, building the
+runs dataframe, the distances and AOCC, the summaries, the plots and the comparison statistics.
+Every run appends its wall times and peak RSS to a results file, tagged with the current commit, so that the results
+of different commits can be compared with the `history` command.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+base_path = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(base_path))
+import utils  # noqa: E402
+from generate_logs import generate_logs, bbob_functions, bbob_instances  # noqa: E402
+
+benchmarks = ['startup', 'read_log_dir_with_joblib', 'read_log_files_columns_with_joblib', 'dict_to_df',
+              'add_dist_to_opt', 'add_final_aocc', 'write_dataset', 'load_dataset', 'summarise_process_stats',
+              'summarise_final_stats', 'plots', 'comparison_stats', 'plot_rank_tests']
+
+default_output = Path(__file__).parent / 'results/results.jsonl'
+
+
+def measure_command(command: list) -> (float, int):
+    """Wall time and peak RSS in bytes of running `command` as a new process."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=base_path, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise click.ClickException(f'{" ".join(command)} failed with exit code {process.returncode}')
+    # ru_maxrss is given in KiB on Linux
+    return time.perf_counter() - start, usage.ru_maxrss * 1024
+
+
+def git_commit() -> (str, bool):
+    """Current commit of the repository and whether the working tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=base_path, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=base_path,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+@click.group()
+def main() -> None:
+    """Benchmarks of the analysis on synthetic logs."""
+
+
+@main.command()
+@click.option('-a', '--algorithms', type=click.STRING, multiple=True, default=['PSO', 'SHADE', 'PSO_RR'],
+              show_default=True, help='Algorithms; the comparison benchmarks need at least two.')
+@click.option('-d', '--dimensions', type=click.STRING, multiple=True, default=['d10'], show_default=True)
+@click.option('-r', '--runs', type=click.INT, default=10, show_default=True, help='Runs per function instance.')
+@click.option('-s', '--steps', type=click.INT, default=100, show_default=True, help='Logged steps per run.')
+@click.option('-f', '--functions', type=click.IntRange(1, 24), default=24, show_default=True,
+              help='Number of BBOB functions.')
+@click.option('-i', '--instances', type=click.IntRange(1, 5), default=5, show_default=True,
+              help='Number of BBOB instances.')
+@click.option('-j', '--n-jobs', type=click.INT, default=-1, help='Number of worker processes (-1: all CPUs).')
+@click.option('-b', '--benchmarks', 'selected', type=click.Choice(benchmarks), multiple=True, default=benchmarks,
+              help='Benchmarks to run (default: all).')
+@click.option('--repeat', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of times to run every benchmark.')
+@click.option('--work-directory', type=click.Path(file_okay=False), default=None,
+              help='Directory of the generated logs and outputs, kept to reuse the logs (default: temporary).')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=str(default_output), show_default=True,
+              help='Results file to append the results to.')
+@click.option('--label', type=click.STRING, default='', help='Label of the results, e.g. the machine.')
+def run(algorithms: tuple, dimensions: tuple, runs: int, steps: int, functions: int, instances: int, n_jobs: int,
+        selected: tuple, repeat: int, work_directory: str, output: str, label: str) -> None:
+    """Runs the benchmarks and appends their results to the results file."""
+    commit, dirty = git_commit()
+    config = {'commit': commit, 'dirty': dirty, 'date': datetime.now().isoformat(timespec='seconds'), 'label': label,
+              'runs': runs, 'steps': steps, 'functions': functions, 'instances': instances, 'n_jobs': n_jobs}
+    temporary = work_directory is None
+    work_directory = Path(tempfile.mkdtemp(prefix='benchmarks-') if temporary else work_directory)
+    functions = bbob_functions[:functions]
+    instances = bbob_instances[:instances]
+    results = []
+
+    profiler = utils.StageProfiler(interval=0.01)
+    # import all submodules of utils up front, so that their import time (see the startup benchmarks) is not
+    # attributed to the first benchmark using them
+    for name in utils.__all__:
+        getattr(utils, name)
+
+    def record(benchmark: str, algorithm: str, dimension: str, k: int, wall_time: float, peak_rss: int,
+               cpu_time: float = None, rss_increase: int = None, rows: int = None):
+        results.append({**config, 'benchmark': benchmark, 'algorithm': algorithm, 'dimension': dimension,
+                        'repeat': k, 'wall_time': wall_time, 'cpu_time': cpu_time, 'peak_rss': peak_rss / 2 ** 20,
+                        'rss_increase': None if rss_increase is None else rss_increase / 2 ** 20, 'rows': rows})
+        print(f'{benchmark:<36} {algorithm or "":<9} {dimension or "":<4} {wall_time:9.3f} s '
+              f'{peak_rss / 2 ** 20:9.1f} MiB')
+
+    def measure(benchmark: str, algorithm: str, dimension: str, k: int, function, *args, **kwargs):
+        """Run `function` (if its benchmark is selected, otherwise untimed) and record its measurement."""
+        if benchmark not in selected:
+            return function(*args, **kwargs)
+        with profiler.stage(benchmark) as stage:
+            result = function(*args, **kwargs)
+        rows = len(result) if isinstance(result, (pd.DataFrame, dict, list)) else None
+        record(benchmark, algorithm, dimension, k, stage.wall_time, stage.peak_rss, stage.cpu_time,
+               stage.peak_rss - stage.start_rss, rows)
+        return result
+
+    try:
+        for k in range(repeat):
+            if 'startup' in selected:
+                for name, command in [('startup', [sys.executable, 'cli.py', '--help']),
+                                      ('startup convert', [sys.executable, 'cli.py', 'convert', '--help']),
+                                      ('startup analyse', [sys.executable, 'cli.py', 'analyse', '--help']),
+                                      ('startup compare', [sys.executable, 'cli.py', 'compare', '--help'])]:
+                    record(name, None, None, k, *measure_command(command))
+
+            for dimension in dimensions:
+                instance_summaries = {}
+                for a, algorithm in enumerate(algorithms):
+                    log_directory = work_directory / 'logs' / algorithm / dimension
+                    n_logs = runs * len(functions) * len(instances)
+                    if len(list(log_directory.glob('*.cbor'))) != n_logs:
+                        shutil.rmtree(log_directory, ignore_errors=True)
+                        generate_logs(log_directory, algorithm, dimension, runs, steps, functions, instances, seed=a)
+                    instance_summaries[algorithm] = run_pipeline(
+                        measure, selected, algorithm, dimension, k, log_directory,
+                        work_directory / 'outputs' / f'{algorithm}_{dimension}', n_jobs)
+
+                if len(algorithms) < 2:
+                    continue
+                results_df = pd.concat(instance_summaries.values(), ignore_index=True)
+                function_tests = measure(
+                    'comparison_stats', None, dimension, k, lambda: utils.friedman_nemenyi(utils.block_design(
+                        results_df, 'FinalDistance_mean',
+                        {'Function': functions, 'Instance': instances, 'Algorithm': list(algorithms)})))
+                if 'plot_rank_tests' in selected:
+                    p_values = pd.DataFrame(function_tests['nemenyi'][0], index=list(algorithms),
+                                            columns=list(algorithms))
+                    avg_ranks = pd.Series(function_tests['average_ranks'][0], index=list(algorithms))
+                    colors = {algorithm: f'C{a}' for a, algorithm in enumerate(algorithms)}
+                    crd_directory = work_directory / 'outputs' / f'crd_{dimension}'
+                    crd_directory.mkdir(parents=True, exist_ok=True)
+                    measure('plot_rank_tests', None, dimension, k, utils.plot_rank_tests, p_values, avg_ranks, colors,
+                            None, crd_directory / 'signplot', crd_directory / 'crd')
+    finally:
+        if temporary:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open('a') as fp:
+        for result in results:
+            fp.write(json.dumps(result) + '\n')
+    print(f'{len(results)} results appended to {output}')
+
+
+def run_pipeline(measure, selected: tuple, algorithm: str, dimension: str, k: int, log_directory: Path,
+                 output_directory: Path, n_jobs: int) -> pd.DataFrame:
+    """
+    Run the conversion and analysis steps of one algorithm and dimension like `convert_log_files.py` and
+    `analysis.py`, measuring the selected steps.
+
+    :return: Final summaries per function instance, for the comparison benchmarks.
+    """
+    shutil.rmtree(output_directory, ignore_errors=True)
+    output_directory.mkdir(parents=True)
+    paths = sorted(log_directory.glob('*.cbor'))
+
+    if 'read_log_dir_with_joblib' in selected:
+        measure('read_log_dir_with_joblib', algorithm, dimension, k, utils.read_log_dir_with_joblib, log_directory,
+                n_jobs)
+    logs = measure('read_log_files_columns_with_joblib', algorithm, dimension, k,
+                   utils.read_log_files_columns_with_joblib, paths, utils.log_fields, n_jobs)
+    df = measure('dict_to_df', algorithm, dimension, k, utils.dict_to_df, logs, algorithm)
+    del logs
+    measure('add_dist_to_opt', algorithm, dimension, k, lambda: utils.add_dist_to_opt(df, base_path / 'datasets') or df)
+    utils.add_final_distance(df)
+    measure('add_final_aocc', algorithm, dimension, k, lambda: utils.add_final_aocc(df) or df)
+
+    runs_directory = output_directory / 'runs'
+    measure('write_dataset', algorithm, dimension, k, lambda: utils.write_dataset(df, runs_directory) or df)
+    del df
+    value_columns = ['DistanceToOptimum', 'MinimumIndividualDistance']
+    columns = ['Algorithm', 'Function', 'Instance', 'Run', 'Iterations', 'Evaluations', 'FinalDistance',
+               'AOCC'] + value_columns
+    df = measure('load_dataset', algorithm, dimension, k, utils.load_dataset, runs_directory,
+                 {'Algorithm': algorithm, 'Dimension': dimension}, columns)
+
+    levels = [['Algorithm'], ['Function'], ['Function', 'Instance']]
+    process_stats = measure('summarise_process_stats', algorithm, dimension, k, utils.summarise_process_stats_levels,
+                            df, levels, value_columns, 'Evaluations', ['Algorithm'])
+    final_stats = measure('summarise_final_stats', algorithm, dimension, k, utils.summarise_final_stats_levels,
+                          df, levels, ['FinalDistance', 'AOCC'], ['Algorithm'])
+
+    if 'plots' in selected:
+        mean_columns = [f'{col}_mean' for col in value_columns]
+        std_columns = [f'{col}_std' for col in value_columns]
+        dataset = f'{algorithm}_{dimension}'
+        render_queue = utils.RenderQueue()
+        render_queue.add(utils.plot_summarised_lineplots, process_stats[1], value_columns=mean_columns,
+                         hue='Function', dataset=dataset, config_name='function_process',
+                         save_directory=output_directory)
+        for f, function_df in process_stats[1].groupby('Function', observed=True):
+            render_queue.add(utils.plot_diversity_summarised, function_df, mean_columns, std_columns, dataset,
+                             f'{dataset}_{f}', output_directory)
+        first = df[(df['Function'] == df['Function'].iloc[0]) & (df['Instance'] == df['Instance'].iloc[0])]
+        render_queue.add(utils.plot_descriptive_individual_run, first[['Run', 'Evaluations'] + value_columns],
+                         value_columns=value_columns, hue='Run', style=None, algorithm=algorithm, dataset=dataset,
+                         config_name=f'{dataset}_individual', save_directory=output_directory)
+        measure('plots', algorithm, dimension, k, lambda: render_queue.render(n_jobs) or
+                list(output_directory.glob('*.png')))
+    return final_stats[2]
+
+
+@main.command()
+@click.option('-i', '--input', 'input_path', type=click.Path(dir_okay=False, exists=True),
+              default=str(default_output), show_default=True, help='Results file.')
+@click.option('-b', '--benchmarks', 'selected', type=click.STRING, multiple=True,
+              help='Benchmarks to show (default: all).')
+@click.option('-n', '--last', type=click.INT, default=10, show_default=True, help='Number of most recent commits.')
+def history(input_path: str, selected: tuple, last: int) -> None:
+    """
+    Prints the wall time (fastest repetition, summed over algorithms and dimensions) and peak RSS of every benchmark
+    for the most recent commits, per benchmark configuration.
+    """
+    with open(input_path) as fp:
+        results = pd.DataFrame([json.loads(line) for line in fp if line.strip()])
+    if selected:
+        results = results[results['benchmark'].isin(selected)]
+    results['commit'] = results['commit'].fillna('unknown') + np.where(results['dirty'], '+', '')
+    results['label'] = results['label'].fillna('')
+    results[['algorithm', 'dimension']] = results[['algorithm', 'dimension']].fillna('')
+    settings = ['label', 'runs', 'steps', 'functions', 'instances', 'n_jobs']
+
+    for setting, setting_results in results.groupby(settings, sort=False):
+        commits = setting_results.groupby('commit', sort=False)['date'].min().sort_values().index[-last:]
+        setting_results = setting_results[setting_results['commit'].isin(commits)]
+        fastest = (setting_results.groupby(['commit', 'benchmark', 'algorithm', 'dimension'], sort=False)
+                   .agg(wall_time=('wall_time', 'min'), peak_rss=('peak_rss', 'max')).reset_index())
+        totals = fastest.groupby(['benchmark', 'commit'], sort=False).agg(wall_time=('wall_time', 'sum'),
+                                                                         peak_rss=('peak_rss', 'max'))
+        print(', '.join(f'{name}={value}' for name, value in zip(settings, setting)))
+        for column, unit in [('wall_time', 's'), ('peak_rss', 'MiB')]:
+            table = totals[column].unstack('commit').reindex(columns=commits)
+            print(f'{column} [{unit}]')
+            print(table.to_string(float_format=lambda value: f'{value:.3f}' if unit == 's' else f'{value:.1f}'))
+        print()
+
+
+if __name__ == '__main__':
+    main()
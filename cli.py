@@ -0,0 +1,57 @@
+import importlib
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+import utils
+
+# Module and short help of every command; a module (and everything it imports) is only loaded when its command runs
+commands = {
+    'convert': ('convert_log_files', 'Convert .cbor logs into the runs dataset.'),
+    'analyse': ('analysis', 'Summarise and plot the runs of an algorithm.'),
+    'compare': ('comparison', 'Compare the algorithms with rank tests.'),
+    'pipeline': ('pipeline', 'Run all steps, rerunning only stale ones.'),
+}
+
+
+class LazyGroup(click.Group):
+    """Group whose commands are imported from their modules on first use."""
+
+    def list_commands(self, ctx: click.Context) -> list:
+        return list(commands)
+
+    def get_command(self, ctx: click.Context, name: str):
+        if name not in commands:
+            return None
+        return importlib.import_module(commands[name][0]).main
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        # list the commands without importing them
+        with formatter.section('Commands'):
+            formatter.write_dl([(name, short_help) for name, (_, short_help) in commands.items()])
+
+
+@click.group(cls=LazyGroup)
+@click.option('-t', '--trace', type=click.Path(dir_okay=False), default=None,
+              help='Record wall time, CPU time, peak RSS and rows of every stage, write them as JSON trace to this '
+                   'path and print a summary at exit.')
+@click.option('--profile', type=click.Choice(utils.profilers), default=None,
+              help='Also profile the whole command, written next to the trace (by default in data/profiles).')
+@click.pass_context
+def main(ctx: click.Context, trace: str, profile: str) -> None:
+    """
+    Entry point of all steps of the analysis, e.g. `python cli.py convert -a PSO -d d10`. Only the modules needed by
+    the selected step are imported, which keeps the start-up of short jobs fast.
+    """
+    if profile is not None and trace is None:
+        trace = Path(__file__).parent / f'data/profiles/{ctx.invoked_subcommand}-{datetime.now():%Y%m%d-%H%M%S}.json'
+    if trace is not None:
+        try:
+            utils.enable_profiling(trace, profile, command=ctx.invoked_subcommand)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+
+if __name__ == '__main__':
+    main()
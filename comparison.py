@@ -6,10 +6,6 @@ import os
 
 import numpy as np
 import pandas as pd
-import scipy.stats as st
-import scikit_posthocs as sp
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json
 
 import utils
@@ -17,7 +13,8 @@ import utils
 
 @click.command()
 @click.option('-d', '--dimensions', type=click.STRING, default='d40')
-def main(dimensions: str) -> None:
+@click.option('-j', '--n-jobs', type=click.INT, default=-1, help='Number of worker processes (-1: all CPUs).')
+def main(dimensions: str, n_jobs: int) -> None:
     base_path = Path(__file__).parent
     save_directory = (Path(base_path / 'data')).resolve()
     print(save_directory)
@@ -27,19 +24,22 @@ def main(dimensions: str) -> None:
     pathlib.Path.mkdir(experiment_directory_crd, parents=True, exist_ok=True)
 
     algorithms = ['PSO', 'SHADE', 'PSO_RR',  'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM']
-    process_dict = {}
-    results_dict = {}
 
-    for a in algorithms:
-        df_process = pd.read_feather(
-            save_directory / f'analysis/{a}_{dimensions}/dataframes/{a}_{dimensions}_functions_process_summaries.feather')
-        process_dict[f'{a}_{dimensions}'] = df_process
-        df_results = pd.read_feather(
-            save_directory / f'analysis/{a}_{dimensions}/dataframes/{a}_{dimensions}_functions_summaries.feather')
-        results_dict[f'{a}_{dimensions}'] = df_results
-
-    process_df = pd.concat(process_dict)
-    results_df = pd.concat(results_dict)
+    # All summaries of the dimension from the summary store written by the analysis
+    store_directory = save_directory / 'dataframes/summaries'
+    store_filter = {'Dimension': dimensions, 'Algorithm': algorithms}
+    kinds = ['functions_process_summaries', 'functions_summaries', 'instances_summaries']
+    missing = [algorithm for algorithm in algorithms
+               if not all((store_directory / kind / f'Dimension={dimensions}' / f'Algorithm={algorithm}').is_dir()
+                          for kind in kinds)]
+    if missing:
+        raise click.ClickException(f"No summaries of {', '.join(missing)} in dimension {dimensions} in "
+                                   f"{store_directory}; run analysis.py for them first.")
+    with utils.stage('load summaries') as stage:
+        process_df = utils.load_dataset(store_directory / 'functions_process_summaries', store_filter, format='ipc')
+        results_df = utils.load_dataset(store_directory / 'functions_summaries', store_filter, format='ipc')
+        instance_results_df = utils.load_dataset(store_directory / 'instances_summaries', store_filter, format='ipc')
+        stage.rows = len(process_df) + len(results_df) + len(instance_results_df)
 
     functions = ['f001', 'f002', 'f003', 'f004', 'f005', 'f006', 'f007', 'f008', 'f009', 'f010', 'f011', 'f012', 'f013',
                  'f014', 'f015', 'f016', 'f017', 'f018', 'f019', 'f020', 'f021', 'f022', 'f023', 'f024']
@@ -49,120 +49,57 @@ def main(dimensions: str) -> None:
     colors = {'PSO': 'C0', 'SHADE': 'C1', 'PSO_RR': 'C2', 'PSO_GPGM': 'C3', 'PSO_NPGM': 'C4', 'PSO_PDM': 'C5',
               'PSO_SRM': 'C6'}
 
+    render_queue = utils.RenderQueue()
     function_groups = [y for x, y in process_df.groupby('Function', observed=False)]
     for function_df in function_groups:
         f_name = function_df['Function'].iloc[0]
-        utils.plot_comparison(function_df, ['PSO_RR', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'], ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
-                              f'{f_name}_comparison_PSO_RR', f'{experiment_directory}')
-        utils.plot_comparison(function_df, ['SHADE', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'],
-                              ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
-                              f'{f_name}_comparison_SHADE', f'{experiment_directory}')
-        utils.plot_comparison(function_df, ['PSO', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'],
-                              ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
-                              f'{f_name}_comparison_PSO_Variants', f'{experiment_directory}')
+        render_queue.add(utils.plot_comparison, function_df, ['PSO_RR', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'], ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
+                         f'{f_name}_comparison_PSO_RR', f'{experiment_directory}')
+        render_queue.add(utils.plot_comparison, function_df, ['SHADE', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'],
+                         ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
+                         f'{f_name}_comparison_SHADE', f'{experiment_directory}')
+        render_queue.add(utils.plot_comparison, function_df, ['PSO', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM'],
+                         ['DistanceToOptimum_mean', 'MinimumIndividualDistance_mean'], 'Algorithm', colors,
+                         f'{f_name}_comparison_PSO_Variants', f'{experiment_directory}')
     del function_groups, process_df
 
-    ### load all data to get
-    for f in functions:
-        functions_dict = {}
-        for a in algorithms:
-            df_function_results = pd.read_feather(
-                save_directory / f'analysis/{a}_{dimensions}/dataframes/{a}_{dimensions}_{f}_instances_summaries.feather')
-            functions_dict[f'{a}_{dimensions}_{f}'] = df_function_results
-        function_results_df = pd.concat(functions_dict)
-
-        ### per function statistical tests
-        function_alg_data = []
-        for a in algorithms:
-            i_data = []
-            for i in instances:
-                i_value = function_results_df.loc[(function_results_df.Algorithm == a) & (function_results_df.Instance == i)]['FinalDistance_mean']
-                i_data.append(i_value.iloc[0])
-            function_alg_data.append(i_data)
-        instance_data = np.array(function_alg_data)
-
-        f_res = st.friedmanchisquare(*instance_data)
-
-        # only perform posthoc test if Friedman test indicates significant differences
-        if f_res[1] < 0.05:
-            f_avg_ranks = function_results_df.groupby('Instance').FinalDistance_mean.rank(pct=True).groupby(function_results_df.Algorithm).mean()
-
-            # Perform Nemenyi post hoc test (pairwise comparison p-values)
-            f_p_values_matrix = sp.posthoc_nemenyi_friedman(function_results_df, melted=True, block_col='Instance',
-                                                          block_id_col='Instance', group_col='Algorithm',
-                                                          y_col='FinalDistance_mean')
-
-            results_json = {'Friedman statistic': f_res[0],
-                            'Friedman pvalue': f_res[1],
-                            'Average ranks': f_avg_ranks.to_json(),
-                            'Nemenyi Friedman': f_p_values_matrix.to_json()}
-            with open(experiment_directory_crd / f"comparison_{dimensions}_{f}.json", "w") as outfile:
-                json.dump(results_json, outfile)
-
-            # Plot sign_plot
-            plt.figure(figsize=(8, 8), dpi=200)
-            cmap = ["1"] + sns.color_palette("flare", n_colors=4)
-            heatmap_args = {'cmap': cmap, 'linewidths': 0.25, 'linecolor': '0.5', 'clip_on': False, 'square': True}
-            sp.sign_plot(f_p_values_matrix, **heatmap_args)
-            plt.savefig(f'{experiment_directory_crd}/signplot_{dimensions}_{f}', bbox_inches='tight', pad_inches=0)
-            plt.close()
-
-            # Plot Critical Difference Diagram
-            plt.figure(figsize=(8, 2), dpi=200)
-            plt.title(f'Critical difference diagram of average score ranks for {f}')
-            sp.critical_difference_diagram(
-                f_avg_ranks,  # Average ranks of algorithms
-                f_p_values_matrix,  # Use the p-values from the Nemenyi test
-                color_palette=colors,
-            )
-            plt.savefig(f'{experiment_directory_crd}/crd_{dimensions}_{f}', bbox_inches='tight', pad_inches=0)
-            plt.close()
-
-
-    # Perform Friedman test
-    alg_data = []
-    for a in algorithms:
-        f_data = []
-        for f in functions:
-            f_value = results_df.loc[(results_df.Algorithm == a) & (results_df.Function == f)]['FinalDistance_mean']
-            f_data.append(f_value.iloc[0])
-        alg_data.append(f_data)
-    data = np.array(alg_data)
-
-    res = st.friedmanchisquare(*data)
-
-    # Compute average ranks of each algorithm
-    avg_ranks = results_df.groupby('Function').FinalDistance_mean.rank(pct=True).groupby(results_df.Algorithm).mean()
-
-    # Perform Nemenyi post hoc test (pairwise comparison p-values)
-    p_values_matrix = sp.posthoc_nemenyi_friedman(results_df, melted=True, block_col='Function', block_id_col='Function', group_col='Algorithm', y_col='FinalDistance_mean')
-    print(p_values_matrix)
-
-    results_json = {'Friedman statistic': res[0],
-                    'Friedman pvalue': res[1],
-                    'Average ranks': avg_ranks.to_json(),
-                    'Nemenyi Friedman': p_values_matrix.to_json()}
-    with open(experiment_directory_crd / f"comparison_{dimensions}.json", "w") as outfile:
+    # Friedman and Nemenyi tests per function (blocks: instances) and over all functions (blocks: functions), each
+    # computed for all blocked designs at once
+    with utils.stage('rank tests per function', rows=len(functions)):
+        function_tests = utils.friedman_nemenyi(
+            utils.block_design(instance_results_df, 'FinalDistance_mean',
+                               {'Function': functions, 'Instance': instances, 'Algorithm': algorithms}))
+    with utils.stage('rank tests over all functions', rows=1):
+        all_tests = utils.friedman_nemenyi(
+            utils.block_design(results_df, 'FinalDistance_mean', {'Algorithm': algorithms, 'Function': functions})
+            .T[np.newaxis])
+
+    results_json = {}
+    for name, tests, t in [('all', all_tests, 0)] + [(f, function_tests, t) for t, f in enumerate(functions)]:
+        avg_ranks = pd.Series(tests['average_ranks'][t], index=algorithms, name='FinalDistance_mean').sort_index()
+        p_values_matrix = pd.DataFrame(tests['nemenyi'][t], index=algorithms, columns=algorithms)
+        results_json[name] = {'Friedman statistic': tests['statistic'][t],
+                              'Friedman pvalue': tests['pvalue'][t],
+                              'Average ranks': avg_ranks.to_json(),
+                              'Nemenyi Friedman': p_values_matrix.to_json()}
+
+        # only plot the posthoc test of functions if the Friedman test indicates significant differences
+        if name == 'all':
+            print(p_values_matrix)
+            render_queue.add(utils.plot_rank_tests, p_values_matrix, avg_ranks, colors, None,
+                             f'{experiment_directory_crd}/signplot_{dimensions}',
+                             f'{experiment_directory_crd}/crd_{dimensions}')
+        elif tests['pvalue'][t] < 0.05:
+            render_queue.add(utils.plot_rank_tests, p_values_matrix, avg_ranks, colors,
+                             f'Critical difference diagram of average score ranks for {name}',
+                             f'{experiment_directory_crd}/signplot_{dimensions}_{name}',
+                             f'{experiment_directory_crd}/crd_{dimensions}_{name}')
+
+    with open(experiment_directory_crd / f"comparison_{dimensions}_tests.json", "w") as outfile:
         json.dump(results_json, outfile)
 
-    # Plot sign_plot
-    plt.figure(figsize=(8, 8), dpi=200)
-    cmap = ["1"] + sns.color_palette("flare", n_colors=4)
-    heatmap_args = {'cmap': cmap, 'linewidths': 0.25, 'linecolor': '0.5', 'clip_on': False, 'square': True}
-    sp.sign_plot(p_values_matrix, **heatmap_args)
-    plt.savefig(f'{experiment_directory_crd}/signplot_{dimensions}', bbox_inches='tight', pad_inches=0)
-    plt.close()
-
-    # Plot Critical Difference Diagram
-    plt.figure(figsize=(8, 2), dpi=200)
-    sp.critical_difference_diagram(
-        avg_ranks,  # Average ranks of algorithms
-        p_values_matrix,  # Use the p-values from the Nemenyi test
-        color_palette=colors,
-    )
-    plt.savefig(f'{experiment_directory_crd}/crd_{dimensions}', bbox_inches='tight', pad_inches=0)
-    plt.close()
-
+    with utils.stage('render plots', rows=len(render_queue.specs)):
+        render_queue.render(n_jobs)
 
 if __name__ == '__main__':
     main()
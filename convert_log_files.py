@@ -1,4 +1,5 @@
 import os
+import shutil
 from typing import Optional
 
 import click
@@ -12,7 +13,8 @@ import utils
 @click.command()
 @click.option('-a', '--algorithm', type=click.STRING, default='PSO')
 @click.option('-d', '--dimension', type=click.STRING, default='d10')
-def main(algorithm: str, dimension: str) -> None:
+@click.option('--full', is_flag=True, default=False, help='Convert all logs again, not only new or changed ones.')
+def main(algorithm: str, dimension: str, full: bool) -> None:
     base_path = pathlib.Path(__file__).parent
     folder = rf'{algorithm}/{dimension}'
     log_directory = (pathlib.Path(base_path / '..' / 'exploration-mechanisms' / 'data' / folder)).resolve()
@@ -24,18 +26,58 @@ def main(algorithm: str, dimension: str) -> None:
     print(log_directory)
     print(save_directory)
 
-    logs = utils.read_log_dir_with_joblib(log_directory)
+    pathlib.Path.mkdir(save_directory / f'dataframes', parents=True, exist_ok=True)
+    runs_directory = save_directory / 'dataframes/runs'
+    partition_directory = runs_directory / f'Algorithm={algorithm}/Dimension={dimension}'
+    manifest_path = save_directory / f'dataframes/{algorithm}_{dimension}_manifest.json'
+
+    # Only parse logs that are not yet converted or have changed since; without a manifest of the current conversion
+    # code (or with --full), all logs are converted again and replace the converted runs
+    code_version = utils.code_fingerprint(base_path, 'convert_log_files.py')
+    manifest = {}
+    if not full and partition_directory.exists():
+        manifest = utils.read_manifest(manifest_path, code_version)
+    rebuild = not manifest
+    with utils.stage('scan logs') as stage:
+        changed, removed, manifest = utils.scan_log_dir(log_directory, manifest)
+        stage.rows = len(changed)
+    print(f'{len(changed)} new or changed logs, {len(removed)} removed logs')
+    if not changed and not removed:
+        # keep the logs that were only touched, so they are not hashed again
+        utils.write_manifest(manifest_path, manifest, code_version)
+        return
 
-    df = utils.dict_to_df(logs, algorithm)
+    with utils.stage('read logs', rows=len(changed)):
+        logs = utils.read_log_files_columns_with_joblib(changed, utils.log_fields)
+
+    with utils.stage('build frame', rows=len(logs)):
+        df = utils.dict_to_df(logs, algorithm)
     print(df.head())
 
-    pathlib.Path.mkdir(save_directory / f'dataframes', parents=True, exist_ok=True)
+    with utils.stage('distance and AOCC', rows=len(df)):
+        utils.add_dist_to_opt(df, dataset_directory)
+        utils.add_final_distance(df)
+        utils.add_final_aocc(df)
 
-    utils.add_dist_to_opt(df, dataset_directory)
-    utils.add_final_distance(df)
-    utils.add_final_aocc(df)
+    # Merge with the already converted runs, rewriting only the partitions of affected functions
+    functions = sorted(set(df['Function'].astype(str)) | {name.split('_')[2] for name in removed})
+    if rebuild:
+        functions = sorted(set(functions) | {path.name.split('=')[1]
+                                             for path in partition_directory.glob('Function=*')})
+    else:
+        with utils.stage('merge runs') as stage:
+            converted = utils.load_dataset(runs_directory,
+                                           {'Algorithm': algorithm, 'Dimension': dimension, 'Function': functions})
+            df = utils.merge_runs(converted, df, removed)
+            stage.rows = len(df)
 
-    df.to_feather(save_directory / f'dataframes/{algorithm}_{dimension}_full.feather')
+    # The partitions of the written functions are replaced by the write; partitions of functions without runs left
+    # are only removed afterwards, so an interrupted conversion never loses converted runs
+    with utils.stage('write dataset', rows=len(df)):
+        utils.write_dataset(df, runs_directory)
+    for f in sorted(set(functions) - set(df['Function'].astype(str))):
+        shutil.rmtree(partition_directory / f'Function={f}', ignore_errors=True)
+    utils.write_manifest(manifest_path, manifest, code_version)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+import sys
+from pathlib import Path
+
+import click
+
+import utils
+
+algorithms = ['PSO', 'SHADE', 'PSO_RR', 'PSO_GPGM', 'PSO_NPGM', 'PSO_PDM', 'PSO_SRM']
+steps = ['convert', 'analyse', 'compare']
+
+# Kinds of summaries written to the summary store by the analysis and those read by the comparison
+analysis_summaries = [f'{level}_{kind}' for level in ['all', 'functions', 'instances']
+                      for kind in ['summaries', 'process_summaries']]
+comparison_summaries = ['functions_process_summaries', 'functions_summaries', 'instances_summaries']
+
+
+@click.command()
+@click.option('-a', '--algorithms', 'selected_algorithms', type=click.STRING, multiple=True, default=algorithms,
+              show_default=True)
+@click.option('-d', '--dimensions', type=click.STRING, multiple=True, required=True)
+@click.option('-s', '--steps', 'selected_steps', type=click.Choice(steps), multiple=True, default=steps,
+              show_default=True, help='Steps to run; earlier steps not selected are assumed to be up-to-date.')
+@click.option('-p', '--parallel', type=click.INT, default=1, help='Number of tasks to run at once.')
+@click.option('-j', '--n-jobs', type=click.INT, default=-1, help='Number of worker processes per task (-1: all CPUs).')
+@click.option('--force', is_flag=True, help='Run all tasks, even if they are up-to-date.')
+def main(selected_algorithms: tuple, dimensions: tuple, selected_steps: tuple, parallel: int, n_jobs: int,
+         force: bool) -> None:
+    """
+    Runs conversion, analysis and comparison for the given algorithms and dimensions, rerunning only the tasks
+    whose inputs changed since their last successful run.
+    """
+    base_path = Path(__file__).parent
+    save_directory = (Path(base_path / 'data')).resolve()
+    Path.mkdir(save_directory, parents=True, exist_ok=True)
+    runs_directory = save_directory / 'dataframes/runs'
+    store_directory = save_directory / 'dataframes/summaries'
+
+    tasks = []
+    for dimension in dimensions:
+        for algorithm in selected_algorithms:
+            convert_name = f'convert {algorithm} {dimension}'
+            if 'convert' in selected_steps:
+                log_directory = (base_path / '..' / 'exploration-mechanisms' / 'data' / algorithm / dimension).resolve()
+                tasks.append(utils.Task(
+                    convert_name,
+                    [sys.executable, base_path / 'convert_log_files.py', '-a', algorithm, '-d', dimension],
+                    fingerprint=lambda log_directory=log_directory: logs_fingerprint(log_directory, base_path),
+                    outputs=[runs_directory / f'Algorithm={algorithm}/Dimension={dimension}']))
+
+            if 'analyse' in selected_steps:
+                run_filter = {'Algorithm': algorithm, 'Dimension': dimension}
+                tasks.append(utils.Task(
+                    f'analyse {algorithm} {dimension}',
+                    [sys.executable, base_path / 'analysis.py', '-a', algorithm, '-d', dimension, '-j', n_jobs],
+                    fingerprint=lambda run_filter=run_filter: utils.combine_fingerprints(
+                        utils.dataset_fingerprint(runs_directory, run_filter),
+                        utils.code_fingerprint(base_path, 'analysis.py')),
+                    outputs=[store_directory / kind / f'Dimension={dimension}/Algorithm={algorithm}'
+                             for kind in analysis_summaries],
+                    dependencies=[convert_name] if 'convert' in selected_steps else []))
+
+        if 'compare' in selected_steps:
+            tasks.append(utils.Task(
+                f'compare {dimension}',
+                [sys.executable, base_path / 'comparison.py', '-d', dimension, '-j', n_jobs],
+                fingerprint=lambda dimension=dimension: utils.combine_fingerprints(
+                    *[utils.dataset_fingerprint(store_directory / kind, {'Dimension': dimension}, format='ipc')
+                      for kind in comparison_summaries],
+                    utils.code_fingerprint(base_path, 'comparison.py')),
+                outputs=[save_directory / f'comparison/{dimension}/crd/comparison_{dimension}_tests.json'],
+                dependencies=[f'analyse {algorithm} {dimension}' for algorithm in selected_algorithms
+                              if 'analyse' in selected_steps]))
+
+    ran, skipped, failed = utils.run_tasks(tasks, save_directory / 'pipeline_state.json', parallel, force,
+                                           cwd=base_path)
+    print(f'{len(ran)} tasks run, {len(skipped)} up-to-date, {len(failed)} failed')
+    if failed:
+        raise click.ClickException(f'Failed tasks: {", ".join(failed)}')
+
+
+def logs_fingerprint(log_directory: Path, base_path: Path):
+    """
+    Fingerprint of the .cbor logs in `log_directory` and of the conversion code (including the optima of the
+    functions, see `utils.script_dependencies`); None if there are no logs.
+    """
+    if not log_directory.is_dir():
+        return None
+    return utils.combine_fingerprints(utils.files_fingerprint(log_directory.glob('*.cbor'), log_directory),
+                                      utils.code_fingerprint(base_path, 'convert_log_files.py'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,62 @@
-from utils.read_data import *
-from utils.df_format import *
-from utils.calc_stats import *
-from utils.descriptive_stats import *
-from utils.descriptive_plots import *
-from utils.figures import *
+"""
+Utilities of the analysis. The names of all submodules are available directly from the package (e.g.
+`utils.load_dataset`), but a submodule is only imported when one of its names is first used (PEP 562), so e.g. the
+conversion does not pay for importing the plotting and statistics backends.
+"""
+import importlib
 
+# Public names of every submodule (their `__all__`), in the order of the former star imports
+_submodule_names = {
+    'read_data': ['read_log', 'read_log_and_name', 'read_log_columns', 'read_log_columns_and_name',
+                  'read_log_dir_columns_with_joblib', 'read_log_files_columns_with_joblib',
+                  'accumulate_log_files_with_joblib', 'read_dataframe', 'write_dataframe', 'df_to_table',
+                  'partition_columns', 'write_dataset', 'load_dataset', 'dataset_fingerprint', 'table_to_df',
+                  'read_log_dir', 'read_log_dir_with_joblib', 'read_partial_logs_with_joblib'],
+    'ragged': ['flatten_trajectories', 'trajectory_lengths', 'last_values', 'take_trajectories', 'step_grid',
+               'align_trajectories', 'to_list_column', 'list_types_mapper'],
+    'df_format': ['config_labels', 'config_dict', 'common_labels', 'log_fields', 'trajectory_dict', 'group1', 'group2',
+                  'group3', 'group4', 'group5', 'PSO_labels', 'SHADE_labels', 'PSO_RR_labels', 'PSO_GPGM_labels',
+                  'PSO_NPGM_labels', 'PSO_PDM_labels', 'PSO_SRM_labels', 'parameter_dict', 'algorithm_schemas',
+                  'function_groups', 'config_positions', 'parse_config_names', 'dict_to_df', 'merge_runs',
+                  'read_optima', 'add_dist_to_opt', 'log_distance_to_optimum', 'add_final_distance', 'add_final_aocc'],
+    'manifest': ['file_hash', 'files_fingerprint', 'read_manifest', 'write_manifest', 'scan_log_dir'],
+    'calc_stats': ['basic_statistics', 'calculate_statistics', 'calculate_list_statistics', 'grouped_moments',
+                   'merge_moments', 'moments_to_statistics', 'grouped_medians', 'step_statistics', 'aocc',
+                   'aocc_batch'],
+    'rank_tests': ['block_design', 'rank_blocks', 'friedman_tests', 'average_ranks', 'nemenyi_tests',
+                   'friedman_nemenyi'],
+    'descriptive_stats': ['statistic_names', 'summary_modules', 'summarise_final_stats', 'summarise_process_stats',
+                          'summarise_final_stats_levels', 'summarise_process_stats_levels',
+                          'summarise_stats_by_partition', 'summarise_accumulators', 'save_final_summaries',
+                          'save_process_summaries', 'save_to_summary_store', 'SummaryCache'],
+    'descriptive_plots': ['plot_descriptive_individual_run', 'plot_summarised_lineplots', 'plot_diversity_summarised',
+                          'plot_comparison'],
+    'figures': ['setup_figs', 'setup_figs_descriptive', 'themes', 'use_theme', 'RenderQueue', 'decimate',
+                'setup_figs_latex', 'plot_descriptive_lineplots', 'plot_descriptive_summarised_lineplots',
+                'plot_twinaxes', 'plot_rank_tests'],
+    'pipeline': ['Task', 'script_dependencies', 'combine_fingerprints', 'code_fingerprint', 'read_state', 'write_state',
+                 'run_tasks'],
+    'accumulators': ['StepMoments', 'QuantileSketch', 'StepAccumulator'],
+    'profiling': ['Stage', 'StageProfiler', 'stage', 'enable_profiling', 'profilers'],
+}
+
+# Submodule defining every public name
+_modules = {name: module for module, names in _submodule_names.items() for name in names}
+
+__all__ = list(_modules)
+
+
+def __getattr__(name: str):
+    if name in _modules:
+        value = getattr(importlib.import_module(f'{__name__}.{_modules[name]}'), name)
+    elif name in _submodule_names:
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    # later lookups find the name without calling this function
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__) | set(_submodule_names))
@@ -0,0 +1,222 @@
+"""
+Online accumulators of per-step statistics over runs that are added one at a time, e.g. while the logs are read
+(see `utils.accumulate_log_files_with_joblib`), so the trajectories of all runs never have to be in memory at once.
+Accumulators of different runs (e.g. of different workers) can be merged.
+"""
+import numpy as np
+
+from utils.ragged import align_trajectories
+
+__all__ = ["StepMoments", "QuantileSketch", "StepAccumulator"]
+
+
+class StepMoments:
+    """
+    Number of values, mean, sum of squared deviations from the mean (M2), minimum and maximum per step, updated with
+    Welford's algorithm for every added run and merged with the pairwise update of Chan et al.
+    Runs may have different lengths; missing (NaN) values are ignored.
+    """
+
+    def __init__(self):
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def _grow(self, n_steps: int):
+        """Extend the arrays to `n_steps` steps."""
+        missing = n_steps - len(self)
+        if missing > 0:
+            self.count = np.concatenate([self.count, np.zeros(missing, dtype=np.int64)])
+            self.mean = np.concatenate([self.mean, np.zeros(missing)])
+            self.m2 = np.concatenate([self.m2, np.zeros(missing)])
+            self.min = np.concatenate([self.min, np.full(missing, np.inf)])
+            self.max = np.concatenate([self.max, np.full(missing, -np.inf)])
+
+    def add(self, values: np.ndarray) -> 'StepMoments':
+        """Add the trajectory of one run."""
+        values = np.asarray(values, dtype=np.float64)
+        self._grow(len(values))
+        steps = np.flatnonzero(~np.isnan(values))
+        values = values[steps]
+        self.count[steps] += 1
+        delta = values - self.mean[steps]
+        self.mean[steps] += delta / self.count[steps]
+        self.m2[steps] += delta * (values - self.mean[steps])
+        self.min[steps] = np.minimum(self.min[steps], values)
+        self.max[steps] = np.maximum(self.max[steps], values)
+        return self
+
+    def merge(self, other: 'StepMoments') -> 'StepMoments':
+        """Merge the moments of `other` into these moments."""
+        self._grow(len(other))
+        n = len(other)
+        count = self.count[:n] + other.count
+        with np.errstate(invalid='ignore'):
+            delta = other.mean - self.mean[:n]
+            weight = np.where(count > 0, other.count / np.maximum(count, 1), 0.0)
+            self.mean[:n] += delta * weight
+            self.m2[:n] += other.m2 + delta * delta * self.count[:n] * weight
+        self.count[:n] = count
+        self.min[:n] = np.minimum(self.min[:n], other.min)
+        self.max[:n] = np.maximum(self.max[:n], other.max)
+        return self
+
+    def statistics(self, ddof: int = 0) -> dict:
+        """Mean, standard deviation (with `ddof` delta degrees of freedom), minimum and maximum per step."""
+        present = self.count > 0
+        denominator = (self.count - ddof).astype(np.float64)
+        denominator[denominator <= 0] = np.nan
+        return {
+            'mean': np.where(present, self.mean, np.nan),
+            'std': np.sqrt(self.m2 / denominator),
+            'min': np.where(present, self.min, np.nan),
+            'max': np.where(present, self.max, np.nan)
+        }
+
+
+class QuantileSketch:
+    """
+    Mergeable per-step quantile sketch with logarithmic buckets (like DDSketch): every value is counted in the bucket
+    ((1 + a) / (1 - a))^(i - 1) < |x| / min_value <= ((1 + a) / (1 - a))^i, so every quantile is estimated with a
+    relative error of at most `relative_accuracy` a. Values with |x| < `min_value` are counted as zero.
+    The counts are kept sparse as sorted (step, bucket) keys, so the memory depends on the number of distinct
+    buckets per step and not on the number of runs.
+    """
+
+    # bucket numbers are stored with this offset (negative values get negative bucket numbers), per step
+    _bias = 2 ** 20
+    _stride = 2 ** 21
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-300, buffer_size: int = 2 ** 20):
+        assert 0 < relative_accuracy < 1, 'The relative accuracy has to be between 0 and 1!'
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.buffer_size = buffer_size
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # the buckets of all finite values have to fit into the key range of a step
+        if self._buckets(np.array([np.finfo(np.float64).max]))[0] >= self._bias:
+            raise ValueError(f'Relative accuracy {relative_accuracy} with minimum value {min_value} needs more '
+                             f'buckets per step than the sketch can store ({self._bias - 1}).')
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._buffer = []
+        self._buffered = 0
+
+    def _buckets(self, values: np.ndarray) -> np.ndarray:
+        """Signed bucket number of every value (0 for values counted as zero)."""
+        magnitude = np.abs(values)
+        buckets = np.zeros(len(values), dtype=np.int64)
+        nonzero = magnitude >= self.min_value
+        buckets[nonzero] = np.ceil((np.log(magnitude[nonzero]) - np.log(self.min_value)) / np.log(self.gamma))
+        # the bucket of min_value itself is 0, so positive buckets start at 1
+        buckets[nonzero] += 1
+        return np.where(values < 0, -buckets, buckets)
+
+    def _values(self, buckets: np.ndarray) -> np.ndarray:
+        """Representative value of every bucket (with a relative error of at most the relative accuracy)."""
+        magnitude = self.min_value * 2 * self.gamma ** (np.abs(buckets) - 1) / (1 + self.gamma)
+        return np.where(buckets == 0, 0.0, np.sign(buckets) * magnitude)
+
+    def add(self, values: np.ndarray) -> 'QuantileSketch':
+        """Add the trajectory of one run; missing (NaN) values are ignored."""
+        values = np.asarray(values, dtype=np.float64)
+        steps = np.flatnonzero(~np.isnan(values))
+        self._buffer.append(steps * self._stride + self._buckets(values[steps]) + self._bias)
+        self._buffered += len(steps)
+        if self._buffered >= self.buffer_size:
+            self._compact()
+        return self
+
+    def _compact(self):
+        """Count the buffered keys."""
+        if not self._buffer:
+            return
+        keys, counts = np.unique(np.concatenate(self._buffer), return_counts=True)
+        self._buffer, self._buffered = [], 0
+        self._add_counts(keys, counts)
+
+    def _add_counts(self, keys: np.ndarray, counts: np.ndarray):
+        """Add counts of sorted unique keys."""
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype(np.int64)
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Merge the counts of `other` (with the same accuracy and minimum value) into this sketch."""
+        assert (other.gamma, other.min_value) == (self.gamma, self.min_value), 'Cannot merge different sketches!'
+        self._compact()
+        other._compact()
+        self._add_counts(other.keys, other.counts)
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """Estimated `q`-quantile per step (NaN for steps without values), like the lower quantile of DDSketch."""
+        self._compact()
+        if len(self.keys) == 0:
+            return np.zeros(0)
+        steps = self.keys // self._stride
+        cumulative = np.cumsum(self.counts)
+        present, first = np.unique(steps, return_index=True)
+        totals = np.bincount(steps, weights=self.counts)[present]
+        # rank of the quantile within every step, as position in the cumulative counts over all steps
+        ranks = cumulative[first] - self.counts[first] + np.floor(q * (totals - 1))
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        quantiles = np.full(steps[-1] + 1, np.nan)
+        quantiles[present] = self._values(self.keys[positions] % self._stride - self._bias)
+        return quantiles
+
+    def median(self) -> np.ndarray:
+        """Estimated median per step."""
+        return self.quantile(0.5)
+
+
+class StepAccumulator:
+    """
+    Per-step moments and quantile sketch of the runs of one group. See `StepMoments` and `QuantileSketch`.
+    Without a `grid`, the runs are accumulated by entry, with the steps (e.g. evaluations) of the longest run; this
+    differs from `utils.summarise_process_stats_levels` if the steps of the runs differ (e.g. with restarts). With a
+    `grid` (see `utils.step_grid`), every run is aligned to it like there (see `utils.align_trajectories`), so the
+    summaries agree if the grid is the same.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-300, grid: np.ndarray = None):
+        self.moments = StepMoments()
+        self.sketch = QuantileSketch(relative_accuracy, min_value)
+        self.grid = grid
+        self.steps = grid
+
+    def add(self, values: np.ndarray, steps: np.ndarray = None) -> 'StepAccumulator':
+        """Add the trajectory of one run, with its steps (required with a grid)."""
+        if self.grid is not None:
+            assert steps is not None, 'Aligning runs to the grid requires their steps!'
+            values = align_trajectories(np.asarray(steps), np.array([0, len(steps)]), np.asarray(values, np.float64),
+                                        np.array([0, len(values)]), self.grid)[0]
+            steps = self.grid
+        self.moments.add(values)
+        self.sketch.add(values)
+        if steps is not None and (self.steps is None or len(steps) > len(self.steps)):
+            self.steps = np.asarray(steps)
+        return self
+
+    def merge(self, other: 'StepAccumulator') -> 'StepAccumulator':
+        """Merge the runs of `other` into this accumulator."""
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        if other.steps is not None and (self.steps is None or len(other.steps) > len(self.steps)):
+            self.steps = other.steps
+        return self
+
+    def statistics(self, ddof: int = 0) -> dict:
+        """Mean, standard deviation, (estimated) median, minimum and maximum per step."""
+        statistics = self.moments.statistics(ddof)
+        median = np.full(len(self.moments), np.nan)
+        estimate = self.sketch.median()
+        median[:len(estimate)] = estimate
+        return {'mean': statistics['mean'], 'std': statistics['std'], 'median': median,
+                'min': statistics['min'], 'max': statistics['max']}
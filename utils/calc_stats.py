@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 
-__all__ = ["basic_statistics", "calculate_statistics", "calculate_list_statistics", "aocc"]
+__all__ = ["basic_statistics", "calculate_statistics", "calculate_list_statistics", "grouped_moments", "merge_moments",
+           "moments_to_statistics", "grouped_medians", "step_statistics", "aocc", "aocc_batch"]
 
 
 def basic_statistics(df, step_columns, value_column):
@@ -43,15 +44,194 @@ def calculate_list_statistics(arrays):
     }
 
 
-def f(x, lb, ub) -> float:
+def grouped_moments(arrays: np.ndarray, codes: np.ndarray, n_groups: int) -> dict:
     """
-    Helper for computing the inner sum of the AOCC.
-    :param x: current precision
-    :param lb: lower bound
-    :param ub: upper bound
-    :return: inner sum of AOCC as float
+    Computes sufficient statistics per step for all groups of runs: the number of runs, the mean, the sum of squared
+    deviations from the mean (M2), the minimum and the maximum.
+    Moments of groups can be merged exactly into moments of larger groups with `merge_moments`.
+
+    :param arrays: 2-D array (runs x steps) with the trajectories of all runs.
+    :param codes: Group number (0 to n_groups - 1) of every run.
+    :param n_groups: Number of groups.
+    :return: Dict mapping 'count' to an array (groups) and 'mean', 'm2', 'min', 'max' to 2-D arrays (groups x steps).
+        Statistics of groups without runs are NaN.
+    """
+    arrays, codes = _sort_by_codes(arrays, codes)
+    counts = np.bincount(codes, minlength=n_groups)
+    present = counts > 0
+    starts = (np.cumsum(counts) - counts)[present]
+    moments = {'count': counts}
+    for name in ['mean', 'm2', 'min', 'max']:
+        moments[name] = np.full((n_groups, arrays.shape[1]), np.nan)
+    if not present.any():
+        return moments
+
+    mean = np.add.reduceat(arrays, starts, axis=0) / counts[present, None]
+    # second pass over the deviations for numerical stability, like np.std
+    deviations = arrays - np.repeat(mean, counts[present], axis=0)
+    np.square(deviations, out=deviations)
+    moments['mean'][present] = mean
+    moments['m2'][present] = np.add.reduceat(deviations, starts, axis=0)
+    moments['min'][present] = np.minimum.reduceat(arrays, starts, axis=0)
+    moments['max'][present] = np.maximum.reduceat(arrays, starts, axis=0)
+    return moments
+
+
+def merge_moments(moments: dict, codes: np.ndarray, n_groups: int) -> dict:
+    """
+    Merges moments of groups (see `grouped_moments`) into moments of larger groups, using the pairwise update of
+    Chan et al. for mean and M2.
+
+    :param moments: Moments of the groups to merge.
+    :param codes: Number (0 to n_groups - 1) of the merged group for every group in `moments`.
+    :param n_groups: Number of merged groups.
+    :return: Moments of the merged groups.
+    """
+    keep = moments['count'] > 0
+    moments = {name: values[keep] for name, values in moments.items()}
+    codes = np.asarray(codes)[keep]
+    order = np.argsort(codes, kind='stable')
+    moments = {name: values[order] for name, values in moments.items()}
+    codes = codes[order]
+
+    counts = np.bincount(codes, weights=moments['count'], minlength=n_groups).astype(np.int64)
+    present = np.bincount(codes, minlength=n_groups) > 0
+    starts = np.searchsorted(codes, np.flatnonzero(present))
+    child_counts = moments['count'][:, None].astype(np.float64)
+    merged = {'count': counts}
+    for name in ['mean', 'm2', 'min', 'max']:
+        merged[name] = np.full((n_groups, moments['mean'].shape[1]), np.nan)
+    if not present.any():
+        return merged
+
+    mean = np.add.reduceat(child_counts * moments['mean'], starts, axis=0) / counts[present, None]
+    shift = moments['mean'] - mean[np.searchsorted(np.flatnonzero(present), codes)]
+    merged['mean'][present] = mean
+    merged['m2'][present] = np.add.reduceat(moments['m2'] + child_counts * shift * shift, starts, axis=0)
+    merged['min'][present] = np.minimum.reduceat(moments['min'], starts, axis=0)
+    merged['max'][present] = np.maximum.reduceat(moments['max'], starts, axis=0)
+    return merged
+
+
+def moments_to_statistics(moments: dict, ddof: int = 0) -> dict:
+    """
+    Computes mean, standard deviation (with `ddof` delta degrees of freedom), minimum and maximum from moments.
+    The standard deviation is NaN for groups with not more than `ddof` runs.
+    """
+    denominator = (moments['count'] - ddof).astype(np.float64)[:, None]
+    denominator[denominator <= 0] = np.nan
+    return {
+        'mean': moments['mean'],
+        'std': np.sqrt(moments['m2'] / denominator),
+        'min': moments['min'],
+        'max': moments['max']
+    }
+
+
+def grouped_medians(arrays: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Computes the median per step for all groups of runs; NaN for groups without runs.
+
+    :param arrays: 2-D array (runs x steps) with the trajectories of all runs.
+    :param codes: Group number (0 to n_groups - 1) of every run.
+    :param n_groups: Number of groups.
+    :return: 2-D array (groups x steps).
+    """
+    arrays, codes = _sort_by_codes(arrays, codes)
+    counts = np.bincount(codes, minlength=n_groups)
+    if n_groups > 0 and (counts == counts[0]).all() and counts[0] > 0:
+        return np.median(arrays.reshape(n_groups, counts[0], -1), axis=1)
+
+    medians = np.full((n_groups, arrays.shape[1]), np.nan)
+    for group, (start, count) in enumerate(zip(np.cumsum(counts) - counts, counts)):
+        if count > 0:
+            medians[group] = np.median(arrays[start:start + count], axis=0)
+    return medians
+
+
+def _sort_by_codes(arrays: np.ndarray, codes: np.ndarray) -> (np.ndarray, np.ndarray):
+    """Sort the runs by group number, so every group is one block of rows; no copy if already sorted."""
+    codes = np.asarray(codes)
+    if len(codes) > 1 and (np.diff(codes) < 0).any():
+        order = np.argsort(codes, kind='stable')
+        return arrays[order], codes[order]
+    return arrays, codes
+
+
+def step_statistics(steps: np.ndarray, values: np.ndarray, errorbar: str = None, n_boot: int = 1000,
+                    seed: int = None) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
     """
-    return 1.0 - (min([max([x, lb]), ub]) - lb) / (ub - lb)
+    Aggregates the values of several runs per step like the estimator and error bars of seaborn's lineplot, using
+    vectorised reductions. Missing values are ignored.
+
+    :param steps: Flat array with the step of every value (e.g. the concatenated evaluations of the runs).
+    :param values: Flat array with the values.
+    :param errorbar: None (only the mean), 'sd' (mean +- standard deviation) or 'ci' (95% bootstrap confidence
+        interval of the mean).
+    :param n_boot: Number of bootstrap resamples for 'ci'.
+    :param seed: Seed of the bootstrap resampling.
+    :return: Sorted unique steps, mean per step and lower and upper bound of the error bars (None without errorbar).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    order = np.argsort(steps[valid], kind='stable')
+    steps, values = steps[valid][order], values[valid][order]
+    x, starts, counts = np.unique(steps, return_index=True, return_counts=True)
+    if len(x) == 0:
+        return x, np.empty(0), None, None
+    mean = np.add.reduceat(values, starts) / counts
+
+    if errorbar is None:
+        return x, mean, None, None
+    if errorbar == 'sd':
+        deviations = values - np.repeat(mean, counts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.add.reduceat(deviations * deviations, starts) / (counts - 1))
+        return x, mean, mean - std, mean + std
+    if errorbar == 'ci':
+        # resample the values of every step independently, in chunks of resamples to bound the memory
+        rng = np.random.default_rng(seed)
+        step_starts, step_counts = np.repeat(starts, counts), np.repeat(counts, counts)
+        boot_means = np.empty((n_boot, len(x)))
+        chunk = max(1, 2 ** 24 // len(values))
+        for start in range(0, n_boot, chunk):
+            n = min(chunk, n_boot - start)
+            samples = step_starts + (rng.random((n, len(values))) * step_counts).astype(np.int64)
+            boot_means[start:start + n] = np.add.reduceat(values[samples], starts, axis=1) / counts
+        lower, upper = np.percentile(boot_means, [2.5, 97.5], axis=0)
+        return x, mean, lower, upper
+    raise ValueError(f"Unknown errorbar '{errorbar}', use None, 'sd' or 'ci'.")
+
+
+def aocc_batch(values, offsets=None, lb: float = 0.00000001, ub: float = 100000000.0) -> np.ndarray:
+    """
+    Computes the AOCC for many runs at once.
+    Either `values` is a 2-D array (runs x steps), or a flat values buffer with an `offsets` buffer marking the
+    trajectories of the runs (see utils.flatten_trajectories). Runs without values get NaN.
+
+    :param values: Performance data as 2-D array or flat buffer.
+    :param offsets: Offsets of the runs in the flat buffer (optional).
+    :param lb: Lower bound of precision values.
+    :param ub: Upper bound of precision values.
+    :return: Array with one AOCC value per run.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    log_lb, log_ub = np.log10(lb), np.log10(ub)
+    with np.errstate(divide='ignore'):
+        precision = np.log10(values)
+    np.clip(precision, log_lb, log_ub, out=precision)
+    precision = 1.0 - (precision - log_lb) / (log_ub - log_lb)
+    if offsets is None:
+        return precision.mean(axis=-1)
+
+    lengths = np.diff(offsets)
+    sums = np.zeros(len(lengths))
+    # reduceat needs non-empty segments; empty runs end up as 0 / 0 = NaN
+    non_empty = lengths > 0
+    if non_empty.any():
+        sums[non_empty] = np.add.reduceat(precision, offsets[:-1][non_empty])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / lengths
 
 
 def aocc(df, lb: float = 0.00000001, ub: float = 100000000.0) -> float:
@@ -64,8 +244,4 @@ def aocc(df, lb: float = 0.00000001, ub: float = 100000000.0) -> float:
     :param ub: Upper bound of precision values.
     :return: AOCC value.
     """
-    result = [f(np.log10(x), np.log10(lb), np.log10(ub)) for x in df]
-    aocc_sum = sum(result)
-    aocc_value = aocc_sum / len(df.index)
-
-    return aocc_value
+    return float(aocc_batch(np.asarray(df, dtype=np.float64), lb=lb, ub=ub))
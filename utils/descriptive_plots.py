@@ -5,10 +5,14 @@ import pandas as pd
 
 import utils
 
+__all__ = ["plot_descriptive_individual_run", "plot_summarised_lineplots", "plot_diversity_summarised",
+           "plot_comparison"]
+
 
 # Plot individual info (all data for one or more configs)
 def plot_descriptive_individual_run(df: pd.DataFrame, value_columns: [str] = None, hue: str = None, style: str = None,
-                                    dataset: str = None, algorithm: str = None, config_name: str = None, save_directory: str | Path = None):
+                                    dataset: str = None, algorithm: str = None, config_name: str = None, save_directory: str | Path = None,
+                                    errorbar: str = None, n_boot: int = 1000):
     """
     Creates a .png with the plot for every specified columns over the iterations.
     If a dataframe with more than one row is provided, the plots contain the mean line and the standard deviation.
@@ -19,6 +23,8 @@ def plot_descriptive_individual_run(df: pd.DataFrame, value_columns: [str] = Non
     :param hue: Hue of lines (optional) if several rows are provided.
     :param style: Style of lines (optional) if several rows are provided.
     :param config_name: Name to add to the saved .png (optional); if not provided, will use the first config of the dataframe.
+    :param errorbar: Error bars of lines with several runs (optional): 'sd' or 'ci' (bootstrap confidence interval).
+    :param n_boot: Number of bootstrap resamples for 'ci'.
     """
     if value_columns is None:
         value_columns = ['DistanceToOptimum']
@@ -26,33 +32,21 @@ def plot_descriptive_individual_run(df: pd.DataFrame, value_columns: [str] = Non
     Path.mkdir(output_dir, parents=True, exist_ok=True)
 
     for col in value_columns:
-        if style is None:
-            df_full = df[list({'Evaluations', col, hue})]
-        else:
-            df_full = df[list({'Evaluations', col, hue, style})]
-        df_full = df_full.explode(['Evaluations', col])
-        df_full = df_full.dropna()
-        utils.plot_descriptive_lineplots(df_full, 'Evaluations', col, hue, style,
-                                         f'{output_dir}/{algorithm}_{config_name}')
-        del df_full
+        utils.plot_descriptive_lineplots(df, 'Evaluations', col, hue, style,
+                                         f'{output_dir}/{algorithm}_{config_name}', errorbar, n_boot)
 
 
 # Plot summarised behaviour data in lineplots
 # seaborn lineplot: summary per function
-def plot_summarised_lineplots(df: pd.DataFrame, value_columns, hue, style: str = None, dataset: str = '', config_name: str = '', save_directory: str | Path = None):
+def plot_summarised_lineplots(df: pd.DataFrame, value_columns, hue, style: str = None, dataset: str = '', config_name: str = '', save_directory: str | Path = None,
+                              errorbar: str = None, n_boot: int = 1000):
     if value_columns is None:
         value_columns = ['DistanceToOptimum_mean']
     output_dir = save_directory / f'plots/{dataset}/summary_lineplots/'
     Path.mkdir(output_dir, parents=True, exist_ok=True)
     for col in value_columns:
-        if style is None:
-            df_full = df[list({'Evaluations', col, hue})]
-        else:
-            df_full = df[list({'Evaluations', col, hue, style})]
-        df_full = df_full.explode(['Evaluations', col])
-        df_full = df_full.dropna()
-        utils.plot_descriptive_lineplots(df_full, 'Evaluations', col, hue, style, f'{output_dir}/{config_name}')
-        del df_full
+        utils.plot_descriptive_lineplots(df, 'Evaluations', col, hue, style, f'{output_dir}/{config_name}',
+                                         errorbar, n_boot)
 
 
 def plot_diversity_summarised(df: pd.DataFrame, mean_columns, std_columns, dataset: str, config_name: str, save_directory: str | Path):
@@ -1,4 +1,7 @@
+import hashlib
+import json
 import os
+import shutil
 from pathlib import Path
 
 import pandas as pd
@@ -6,9 +9,20 @@ import numpy as np
 
 import utils
 
+__all__ = ["statistic_names", "summary_modules", "summarise_final_stats", "summarise_process_stats",
+           "summarise_final_stats_levels", "summarise_process_stats_levels", "summarise_stats_by_partition",
+           "summarise_accumulators", "save_final_summaries", "save_process_summaries", "save_to_summary_store",
+           "SummaryCache"]
+
+# Order of the statistics in the summaries
+statistic_names = ['mean', 'std', 'median', 'min', 'max']
+
+# Modules whose code determines the summaries; cached summaries are invalidated when any of them changes
+summary_modules = ['descriptive_stats.py', 'calc_stats.py', 'ragged.py']
+
 
 def summarise_final_stats(df, config_columns, value_columns, additional_columns=None, dataset: str = '',
-                          output_name='', save_directory=''):
+                          output_name='', save_directory='', cache=None, fingerprint=None):
     """
     Summarises single-value data columns grouped by selected configuration columns.
     (Note: This function was created with the help of ChatGPT-4o.)
@@ -21,56 +35,27 @@ def summarise_final_stats(df, config_columns, value_columns, additional_columns=
         dataset (str): Name of the used dataset.
         output_name (str): Name of the output file.
         save_directory: Path to save output.
+        cache (SummaryCache, optional): Cache of earlier summaries (see `summarise_process_stats_levels`).
+        fingerprint (str, optional): Fingerprint of the input data, required with `cache`.
 
     Returns:
         Returns pd.DataFrame: A DataFrame with summary statistics for the specified data columns.
         If output_name is given, saves the data as csv and feather.
     """
-
-    grouped = df.groupby(config_columns, observed=False)
-    results = []
-
-    for group_name, group in grouped:
-        row = {col: group_name[i] if isinstance(group_name, tuple) else group_name
-               for i, col in enumerate(config_columns)}
-
-        # Handle additional columns
-        if additional_columns:
-            for col in additional_columns:
-                unique_values = group[col].unique()
-                if len(unique_values) > 1:
-                    raise ValueError(
-                        f"Column '{col}' has inconsistent values within group {group_name}."
-                    )
-                row[col] = unique_values[0]
-
-        # Add final number of iterations and evaluations
-        for list_col in ['Iterations', 'Evaluations']:
-            row[f"{list_col}_last"] = group[list_col].iloc[0][-1]
-
-        # Process data columns
-        for data_col in value_columns:
-            stats = utils.calculate_statistics(group[data_col])
-            for stat_name, stat_value in stats.items():
-                row[f"{data_col}_{stat_name}"] = stat_value
-        results.append(row)
+    results = summarise_final_stats_levels(df, [config_columns], value_columns, additional_columns, cache,
+                                           fingerprint)[0]
 
     if output_name != '':
-        directory_results = save_directory / f'{dataset}/'
-        directory = save_directory / 'dataframes/'
-        Path.mkdir(directory_results, parents=True, exist_ok=True)
-        Path.mkdir(directory, parents=True, exist_ok=True)
-        pd.DataFrame(results).to_csv(directory_results / f'{dataset}_{output_name}_summaries.csv')
-        pd.DataFrame(results).to_feather(directory / f'{dataset}_{output_name}_summaries.feather')
+        save_final_summaries(results, dataset, output_name, save_directory)
 
-    return pd.DataFrame(results)
+    return results
 
 
 def summarise_process_stats(df, config_columns, value_columns, step_column=None, additional_columns=None,
-                            dataset: str = '', output_name='', save_directory=''):
+                            dataset: str = '', output_name='', save_directory='', cache=None, fingerprint=None):
     """
     Summarises data columns containing lists, grouped by selected configuration columns.
-    (Note: This function was created with the help of ChatGPT-4o.)
+    The statistics of all groups are computed in one vectorised reduction over the stacked trajectories.
 
     Parameters:
         :param df: (pd.DataFrame) The input dataframe.
@@ -81,41 +66,663 @@ def summarise_process_stats(df, config_columns, value_columns, step_column=None,
         :param dataset: (str) Name of the dataset.
         :param output_name: Name of the output file.
         :param save_directory: Path to save output.
+        :param cache: (SummaryCache, optional) Cache of earlier summaries (see `summarise_process_stats_levels`).
+        :param fingerprint: (str, optional) Fingerprint of the input data, required with `cache`.
     Returns:
-        Returns pd.DataFrame: Summary statistics for the specified data columns.
+        Returns pd.DataFrame: Summary statistics for the specified data columns, one row per group. Steps and
+        statistics are Arrow list columns.
         If output_name is given, saves the data as feather.
     """
+    results = summarise_process_stats_levels(df, [config_columns], value_columns, step_column,
+                                             additional_columns, cache, fingerprint)[0]
 
-    grouped = df.groupby(config_columns, observed=False)
-    results = []
+    if output_name != '':
+        save_process_summaries(results, dataset, output_name, save_directory)
+
+    return results
+
+
+def summarise_final_stats_levels(df, levels, value_columns, additional_columns=None, cache=None, fingerprint=None):
+    """
+    Summarises single-value data columns like `summarise_final_stats` for several grouping levels in one pass.
+    See `summarise_process_stats_levels` for the levels and the cache.
+
+    Parameters:
+        :param df: (pd.DataFrame) The input dataframe, or a function loading it.
+        :param levels: (list of lists of str) Columns to group by for every level.
+        :param value_columns: (list of str) Columns containing single values to summarise.
+        :param additional_columns: (list of str, optional) Additional columns to retain if values are consistent;
+            ignored on levels grouped by them.
+        :param cache: (SummaryCache, optional) Cache of earlier summaries.
+        :param fingerprint: (str, optional) Fingerprint of the input data, required with `cache`.
+    Returns:
+        Returns list of pd.DataFrame: Summary statistics for every level.
+    """
+    levels = [[level] if isinstance(level, str) else list(level) for level in levels]
+    if cache is not None:
+        key = cache.key(fingerprint, 'final', levels, value_columns, additional_columns)
+        return cache.get_or_compute(key, summarise_final_stats_levels, df, levels, value_columns, additional_columns)
+    df = df() if callable(df) else df
+    grouping = _LevelGrouping(df, levels)
+    results = grouping.group_keys(additional_columns)
+
+    # Add final number of iterations and evaluations (of the first run in each group)
+    for list_col in ['Iterations', 'Evaluations']:
+        last = utils.last_values(*utils.flatten_trajectories(df[list_col], dtype=None))
+        for result, first_rows in zip(results, grouping.first_rows()):
+            result[f"{list_col}_last"] = last[first_rows]
+
+    # Process data columns, ignoring missing values like pandas
+    for data_col in value_columns:
+        values = df[data_col].to_numpy(dtype=np.float64)
+        runs = np.flatnonzero(~np.isnan(values))
+        level_stats = grouping.statistics(values[runs, np.newaxis], runs, ddof=1)
+        for result, stats in zip(results, level_stats):
+            for stat_name in statistic_names:
+                result[f"{data_col}_{stat_name}"] = stats[stat_name][:, 0]
+
+    return results
+
+
+def summarise_process_stats_levels(df, levels, value_columns, step_column=None, additional_columns=None, cache=None,
+                                   fingerprint=None, alignment='linear', n_points=None, grid=None):
+    """
+    Summarises data columns containing lists like `summarise_process_stats` for several grouping levels in one pass,
+    e.g. [['Algorithm'], ['Function'], ['Function', 'Instance']].
+    Mean, standard deviation, minimum and maximum are computed once for the finest groups (grouped by the columns of
+    all levels) and merged for the levels. Medians cannot be merged and are computed from the runs for every level.
+    If the steps of the runs differ within a group (e.g. for restarts), all runs are first aligned to a common grid of
+    steps, from the latest first step to the last step of all runs (see `utils.align_trajectories`).
+    With a `cache`, summaries of the same input data (by `fingerprint`), columns and code are read from the cache
+    instead; `df` may then be a function loading the dataframe, which is only called if they are not cached.
+
+    Parameters:
+        :param df: (pd.DataFrame) The input dataframe, or a function loading it.
+        :param levels: (list of lists of str) Columns to group by for every level.
+        :param value_columns: (list of str) Columns containing lists to summarise.
+        :param step_column: (str, optional) Column specifying the step numbers of the lists.
+        :param additional_columns: (list of str, optional) Additional columns to retain if values are consistent;
+            ignored on levels grouped by them.
+        :param cache: (SummaryCache, optional) Cache of earlier summaries.
+        :param fingerprint: (str, optional) Fingerprint of the input data (e.g. `utils.dataset_fingerprint`),
+            required with `cache`.
+        :param alignment: (str, optional) Spacing of the common grid of steps, 'linear' or 'log'; None to raise an
+            error instead of aligning runs with differing steps. Requires `step_column`.
+        :param n_points: (int, optional) Number of steps of the common grid, defaults to the longest trajectory.
+        :param grid: (np.ndarray, optional) Common grid of steps to align all runs to, e.g. the grid of several
+            partitions (see `summarise_stats_by_partition`); replaces `alignment` and `n_points`.
+    Returns:
+        Returns list of pd.DataFrame: Summary statistics for every level, in the format of `summarise_process_stats`.
+    """
+    levels = [[level] if isinstance(level, str) else list(level) for level in levels]
+    if cache is not None:
+        key = cache.key(fingerprint, 'process', levels, value_columns, step_column, additional_columns, alignment,
+                        n_points, None if grid is None else np.asarray(grid).tolist())
+        return cache.get_or_compute(key, summarise_process_stats_levels, df, levels, value_columns, step_column,
+                                    additional_columns, None, None, alignment, n_points, grid)
+    df = df() if callable(df) else df
+    grouping = _LevelGrouping(df, levels)
+    results = grouping.group_keys(additional_columns)
+
+    if step_column:
+        steps, step_offsets = utils.flatten_trajectories(df[step_column], dtype=None)
+        if grid is None and alignment is not None and grouping.steps_differ(steps, step_offsets):
+            grid = _common_grid(steps, step_offsets, grouping.valid, alignment, n_points)
+        for result, level, first_rows in zip(results, levels, grouping.first_rows()):
+            if grid is not None:
+                group_steps = np.tile(grid, len(first_rows)), np.arange(len(first_rows) + 1) * len(grid)
+            else:
+                # steps of the first run of each group
+                group_steps = utils.take_trajectories(steps, step_offsets, first_rows)
+            result.insert(len(level), step_column, utils.to_list_column(*group_steps))
 
-    for group_name, group in grouped:
-        row = {col: group_name[i] for i, col in enumerate(config_columns)}
+    # Process data, once for all runs with trajectories of the same length
+    for data_col in value_columns:
+        values, offsets = utils.flatten_trajectories(df[data_col])
+        if grid is not None:
+            values = utils.align_trajectories(steps, step_offsets, values, offsets, grid).ravel()
+            offsets = np.arange(len(offsets)) * len(grid)
+        lengths = utils.trajectory_lengths(offsets)
+        grouping.check_lengths(lengths, data_col)
+
+        level_rows = [{stat_name: np.empty(len(result), dtype=object) for stat_name in statistic_names}
+                      for result in results]
+        for length in np.unique(lengths[grouping.valid]):
+            runs = np.flatnonzero(grouping.valid & (lengths == length))
+            if len(runs) == len(lengths):
+                arrays = values.reshape(len(runs), length)
+            else:
+                arrays = utils.take_trajectories(values, offsets, runs)[0].reshape(len(runs), length)
+            for rows, groups, stats in zip(level_rows, *grouping.statistics(arrays, runs, ddof=0, with_groups=True)):
+                for stat_name in statistic_names:
+                    for group, row in zip(groups, stats[stat_name]):
+                        rows[stat_name][group] = row
+
+        for result, rows in zip(results, level_rows):
+            stat_offsets = np.zeros(len(result) + 1, dtype=np.int64)
+            np.cumsum([len(row) for row in rows['mean']], out=stat_offsets[1:])
+            for stat_name in statistic_names:
+                stat_values = np.concatenate(list(rows[stat_name])) if len(result) > 0 else np.empty(0)
+                result[f"{data_col}_{stat_name}"] = utils.to_list_column(stat_values, stat_offsets)
+
+    return results
+
+
+def summarise_stats_by_partition(load, partitions, partition_column, levels, process_columns, final_columns,
+                                 step_column=None, additional_columns=None, memory_budget=None, cache=None,
+                                 fingerprint=None, alignment='linear', n_points=None):
+    """
+    Summarises process data and final values like `summarise_process_stats_levels` and
+    `summarise_final_stats_levels`, but loads the runs one partition (e.g. one function) at a time, so only one
+    partition is in memory at once.
+    Levels grouped by the partition column are summarised per partition. For the other levels, the moments of every
+    partition are merged; their medians are computed in further passes over the partitions, loading only one value
+    column and keeping at most `memory_budget` bytes of its values (a block of steps of all runs) per pass.
+    Final values are kept for all runs (one row per run) and summarised at the end.
+    If the steps of the runs differ within a group of any level, all runs of all partitions are aligned to one
+    common grid of steps, found in a first pass over the steps of the partitions, so the summaries equal those of
+    `summarise_process_stats_levels` on all runs at once.
+
+    Parameters:
+        :param load: (callable) Function loading the runs of a partition with the given columns (None: all
+            columns needed), e.g. `lambda function, columns: utils.load_dataset(root, {..., 'Function': function},
+            columns)`.
+        :param partitions: (list) Values of the partition column.
+        :param partition_column: (str) Column by which the runs are partitioned.
+        :param levels: (list of lists of str) Columns to group by for every level.
+        :param process_columns: (list of str) Columns containing lists to summarise.
+        :param final_columns: (list of str) Columns containing single values to summarise.
+        :param step_column: (str, optional) Column specifying the step numbers of the lists.
+        :param additional_columns: (list of str, optional) Additional columns to retain if values are consistent.
+        :param memory_budget: (int, optional) Bytes of values kept per pass for the medians of levels spanning
+            several partitions; unbounded by default, i.e. one pass per value column.
+        :param cache: (SummaryCache, optional) Cache of earlier summaries (see `summarise_process_stats_levels`).
+        :param fingerprint: (str, optional) Fingerprint of the input data, required with `cache`.
+        :param alignment: (str, optional) Spacing of the common grid of steps, 'linear' or 'log'; None to raise an
+            error instead of aligning runs with differing steps. Requires `step_column`.
+        :param n_points: (int, optional) Number of steps of the common grid, defaults to the longest trajectory.
+    Returns:
+        Returns tuple of two lists of pd.DataFrame: Summaries of the process data and of the final values for every
+        level.
+    """
+    levels = [[level] if isinstance(level, str) else list(level) for level in levels]
+    partitions = sorted(partitions)
+    if cache is not None:
+        key = cache.key(fingerprint, 'by partition', partition_column, levels, process_columns, final_columns,
+                        step_column, additional_columns, alignment, n_points)
+        results = cache.get_or_compute(key, lambda: [result for results in summarise_stats_by_partition(
+            load, partitions, partition_column, levels, process_columns, final_columns, step_column,
+            additional_columns, memory_budget, alignment=alignment, n_points=n_points) for result in results])
+        return results[:len(levels)], results[len(levels):]
+
+    inner = [i for i, level in enumerate(levels) if partition_column in level]
+    spanning = [i for i, level in enumerate(levels) if partition_column not in level]
+    scalar_columns = list(dict.fromkeys([col for level in levels for col in level] + (additional_columns or [])
+                                        + final_columns))
+    grid = None
+    if step_column and alignment is not None:
+        grid = _partitions_grid(load, partitions, levels, [levels[i] for i in spanning], step_column, alignment,
+                                n_points)
+    inner_results = {i: [] for i in inner}
+    final_frames, partition_moments = [], []
+    for partition in partitions:
+        df = load(partition, None)
+        final_frames.append(_final_values(df, scalar_columns))
+        if inner:
+            results = summarise_process_stats_levels(df, [levels[i] for i in inner], process_columns, step_column,
+                                                     additional_columns, grid=grid)
+            for i, result in zip(inner, results):
+                inner_results[i].append(result)
+        if spanning:
+            partition_moments.append(_PartitionMoments(df, [levels[i] for i in spanning], process_columns,
+                                                       step_column, additional_columns, grid))
+        del df
+
+    final_results = summarise_final_stats_levels(pd.concat(final_frames, ignore_index=True), levels, final_columns,
+                                                 additional_columns)
+    process_results = [None] * len(levels)
+    for i in inner:
+        process_results[i] = pd.concat(inner_results[i], ignore_index=True)
+    if spanning:
+        merged = _merge_partition_moments(load, partitions, [levels[i] for i in spanning], partition_moments,
+                                          process_columns, step_column, additional_columns, memory_budget, grid)
+        for i, result in zip(spanning, merged):
+            process_results[i] = result
+    return process_results, final_results
+
+
+def summarise_accumulators(accumulators: dict, key_columns, step_column=None, ddof=0) -> pd.DataFrame:
+    """
+    Summaries of runs accumulated online (see `utils.accumulate_log_files_with_joblib`) in the format of
+    `summarise_process_stats`. Mean, standard deviation, minimum and maximum are exact, medians are estimated (see
+    `utils.QuantileSketch`). They only equal the summaries of `summarise_process_stats_levels` for runs with differing
+    steps if the runs were accumulated on the same grid of steps (see `utils.StepAccumulator`).
+
+    Parameters:
+        :param accumulators: (dict) Dict mapping the groups to dicts mapping value columns to `utils.StepAccumulator`.
+        :param key_columns: (list of str) Names of the columns of the group keys (tuples for several columns).
+        :param step_column: (str, optional) Name of the column with the step numbers of the lists.
+        :param ddof: (int) Delta degrees of freedom of the standard deviation.
+    Returns:
+        Returns pd.DataFrame: Summary statistics, one row per group (sorted by the group keys).
+    """
+    keys = sorted(accumulators)
+    results = pd.DataFrame([key if isinstance(key, tuple) else (key,) for key in keys], columns=key_columns)
+    value_columns = list(accumulators[keys[0]]) if keys else []
+    if step_column:
+        steps = [next(iter(accumulators[key].values())).steps for key in keys]
+        step_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(group_steps) for group_steps in steps], out=step_offsets[1:])
+        results[step_column] = utils.to_list_column(np.concatenate(steps) if keys else np.empty(0), step_offsets)
+
+    for data_col in value_columns:
+        stats = [accumulators[key][data_col].statistics(ddof) for key in keys]
+        stat_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(group_stats['mean']) for group_stats in stats], out=stat_offsets[1:])
+        for stat_name in statistic_names:
+            stat_values = np.concatenate([group_stats[stat_name] for group_stats in stats]) if keys else np.empty(0)
+            results[f"{data_col}_{stat_name}"] = utils.to_list_column(stat_values, stat_offsets)
+    return results
+
+
+def save_final_summaries(results: pd.DataFrame, dataset: str, output_name: str, save_directory):
+    """Saves summaries of final values as csv and feather (see `summarise_final_stats`)."""
+    directory_results = save_directory / f'{dataset}/'
+    directory = save_directory / 'dataframes/'
+    Path.mkdir(directory_results, parents=True, exist_ok=True)
+    Path.mkdir(directory, parents=True, exist_ok=True)
+    results.to_csv(directory_results / f'{dataset}_{output_name}_summaries.csv')
+    utils.write_dataframe(results, directory / f'{dataset}_{output_name}_summaries.feather')
+
+
+def save_process_summaries(results: pd.DataFrame, dataset: str, output_name: str, save_directory):
+    """Saves summaries of process data as feather (see `summarise_process_stats`)."""
+    directory = save_directory / 'dataframes/'
+    Path.mkdir(directory, parents=True, exist_ok=True)
+    utils.write_dataframe(results, directory / f'{dataset}_{output_name}_process_summaries.feather')
+
+
+def save_to_summary_store(results: pd.DataFrame, store_directory, kind: str, dimension: str, algorithm: str):
+    """
+    Adds summaries to the summary store of all algorithms and dimensions: one Arrow IPC dataset per kind of summaries
+    (e.g. 'functions_summaries'), partitioned by dimension and algorithm (`<kind>/Dimension=d10/Algorithm=PSO/
+    part-0.arrow`), so all summaries of a dimension can be loaded with one memory-mapped read (see
+    `utils.load_dataset`). Earlier summaries of the algorithm and dimension are replaced atomically.
+    """
+    directory = Path(store_directory) / kind / f'Dimension={dimension}' / f'Algorithm={algorithm}'
+    Path.mkdir(directory, parents=True, exist_ok=True)
+    # the partition keys are stored in the directory names
+    results = results.drop(columns=['Dimension', 'Algorithm'], errors='ignore')
+    temporary_path = directory / '.part-0.arrow.tmp'
+    utils.write_dataframe(results, temporary_path, compression='uncompressed')
+    os.replace(temporary_path, directory / 'part-0.arrow')
 
+
+class SummaryCache:
+    """
+    Content-addressed on-disk cache of summaries. Entries are keyed by the fingerprint of the input data, the
+    summarised columns and the version of the summary code (see `summary_modules`), and are stored as one directory
+    of feather files per key. When the cache grows beyond `max_size` bytes, the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, directory, max_size: int = 2 ** 30):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    @staticmethod
+    def code_version() -> str:
+        """Hash of the code of the summary modules."""
+        digest = hashlib.blake2b(digest_size=16)
+        for module in summary_modules:
+            digest.update((Path(__file__).parent / module).read_bytes())
+        return digest.hexdigest()
+
+    def key(self, fingerprint: str, *spec) -> str:
+        """Cache key of the summaries of the input data with `fingerprint`, computed as given by `spec`."""
+        assert fingerprint is not None, 'Cached summaries require the fingerprint of the input data!'
+        content = json.dumps([fingerprint, self.code_version(), *spec])
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str):
+        """List of the cached summaries of `key`, or None if they are not cached."""
+        entry = self.directory / key
+        if not entry.is_dir():
+            return None
+        # mark the entry as recently used
+        os.utime(entry)
+        files = sorted(entry.glob('level-*.feather'), key=lambda file: int(file.stem.split('-')[1]))
+        return [utils.read_dataframe(file) for file in files]
+
+    def put(self, key: str, results: list):
+        """Stores the summaries of `key`, then evicts the least recently used entries if the cache is too large."""
+        Path.mkdir(self.directory, parents=True, exist_ok=True)
+        temporary_entry = self.directory / f'.{key}.tmp'
+        shutil.rmtree(temporary_entry, ignore_errors=True)
+        Path.mkdir(temporary_entry)
+        for i, result in enumerate(results):
+            utils.write_dataframe(result, temporary_entry / f'level-{i}.feather', compression='uncompressed')
+        shutil.rmtree(self.directory / key, ignore_errors=True)
+        os.replace(temporary_entry, self.directory / key)
+        self.evict(keep=key)
+
+    def get_or_compute(self, key: str, summarise, *args) -> list:
+        """Cached summaries of `key`; computes them with `summarise(*args)` and stores them if they are not cached."""
+        results = self.get(key)
+        if results is None:
+            results = summarise(*args)
+            self.put(key, results)
+        return results
+
+    def evict(self, keep: str = None):
+        """Removes the least recently used entries (except `keep`) until the cache is at most `max_size` bytes."""
+        entries = [entry for entry in self.directory.iterdir() if entry.is_dir() and not entry.name.startswith('.')]
+        sizes = {entry: sum(file.stat().st_size for file in entry.iterdir()) for entry in entries}
+        total_size = sum(sizes.values())
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime_ns):
+            if total_size <= self.max_size:
+                break
+            if entry.name != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total_size -= sizes[entry]
+
+
+class _LevelGrouping:
+    """
+    Group numbers of the runs for several grouping levels and for the finest groups, i.e. the groups of all
+    grouping columns together. Every group of a level is a union of finest groups.
+    """
+
+    def __init__(self, df: pd.DataFrame, levels: list):
+        self.levels = levels
+        self.groupings = [df.groupby(level, observed=True) for level in levels]
+        self.codes = [grouping.ngroup().to_numpy() for grouping in self.groupings]
+        self.n_groups = [grouping.ngroups for grouping in self.groupings]
+
+        finest = list(dict.fromkeys(col for level in levels for col in level))
+        self.fine_codes = df.groupby(finest, observed=True).ngroup().to_numpy()
+        self.valid = self.fine_codes >= 0
+        # level group of every finest group
+        fine_groups, fine_first_rows = np.unique(self.fine_codes, return_index=True)
+        fine_first_rows = fine_first_rows[fine_groups >= 0]
+        self.parents = [codes[fine_first_rows] for codes in self.codes]
+
+    def group_keys(self, additional_columns=None) -> list:
+        """One frame per level with the group keys and the consistent additional columns."""
+        return [_group_keys(grouping, level, [col for col in additional_columns or [] if col not in level])
+                for grouping, level in zip(self.groupings, self.levels)]
+
+    def first_rows(self) -> list:
+        """Row of the first run of every group, per level."""
+        first_rows = []
+        for codes in self.codes:
+            groups, rows = np.unique(codes, return_index=True)
+            first_rows.append(rows[groups >= 0])
+        return first_rows
+
+    def steps_differ(self, steps: np.ndarray, offsets: np.ndarray) -> bool:
+        """Whether the steps (flat buffer and offsets) of any run differ from those of the first run of its group."""
+        lengths = utils.trajectory_lengths(offsets)
+        for codes, first_rows in zip(self.codes, self.first_rows()):
+            runs = np.flatnonzero(codes >= 0)
+            references = first_rows[codes[runs]]
+            if (lengths[runs] != lengths[references]).any():
+                return True
+            if not np.array_equal(utils.take_trajectories(steps, offsets, runs)[0],
+                                  utils.take_trajectories(steps, offsets, references)[0]):
+                return True
+        return False
+
+    def check_lengths(self, lengths: np.ndarray, column: str):
+        """Raise an error if the trajectories within a group of any level have different lengths."""
+        for codes, n_groups in zip(self.codes, self.n_groups):
+            valid = codes >= 0
+            shortest = np.full(n_groups, np.iinfo(np.int64).max)
+            longest = np.zeros(n_groups, dtype=np.int64)
+            np.minimum.at(shortest, codes[valid], lengths[valid])
+            np.maximum.at(longest, codes[valid], lengths[valid])
+            if (shortest != longest).any():
+                raise ValueError(f"Column '{column}' has trajectories of different lengths within a group.")
+
+    def statistics(self, arrays: np.ndarray, runs: np.ndarray, ddof: int = 0, with_groups: bool = False):
+        """
+        Statistics per level of the given runs: moments of the finest groups are merged into the level groups,
+        medians are computed per level.
+
+        :param arrays: 2-D array (runs x steps) with the data of the given runs.
+        :param runs: Rows of the runs in the dataframe.
+        :param ddof: Delta degrees of freedom of the standard deviation.
+        :param with_groups: Whether to also return the level groups the statistics belong to. Otherwise, the
+            statistics are returned for all groups of each level (NaN for groups without runs).
+        :return: List of dicts mapping the statistic names to 2-D arrays (groups x steps), per level; with
+            `with_groups`, a tuple of the list of group numbers per level and this list.
+        """
+        fine_groups, fine_codes = np.unique(self.fine_codes[runs], return_inverse=True)
+        moments = utils.grouped_moments(arrays, fine_codes, len(fine_groups))
+
+        level_groups, level_stats = [], []
+        for codes, parents, n_groups in zip(self.codes, self.parents, self.n_groups):
+            groups, parent_codes = np.unique(parents[fine_groups], return_inverse=True)
+            if not with_groups:
+                groups, parent_codes = np.arange(n_groups), parents[fine_groups]
+            stats = utils.moments_to_statistics(utils.merge_moments(moments, parent_codes, len(groups)), ddof)
+            stats['median'] = utils.grouped_medians(arrays, np.searchsorted(groups, codes[runs]), len(groups))
+            level_groups.append(groups)
+            level_stats.append(stats)
+        return (level_groups, level_stats) if with_groups else level_stats
+
+
+def _final_values(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """
+    Single-value columns of the runs, with the trajectories of iterations and evaluations reduced to their last
+    values (as the final summaries only use these).
+    """
+    final = df[columns].copy()
+    for list_col in ['Iterations', 'Evaluations']:
+        last = utils.last_values(*utils.flatten_trajectories(df[list_col], dtype=None))
+        final[list_col] = utils.to_list_column(last, np.arange(len(last) + 1))
+    return final
+
+
+class _PartitionMoments:
+    """
+    Group keys, steps and moments (per trajectory length) of the process data of one partition, for levels whose
+    groups span several partitions. With a `grid`, the runs are aligned to this common grid of steps first.
+    """
+
+    def __init__(self, df: pd.DataFrame, levels: list, value_columns: list, step_column=None,
+                 additional_columns=None, grid=None):
+        grouping = _LevelGrouping(df, levels)
+        self.keys = grouping.group_keys(additional_columns)
         if step_column:
-            row[step_column] = group[step_column].iloc[0]
-
-        # Handle additional columns
-        if additional_columns:
-            for col in additional_columns:
-                unique_values = group[col].unique()
-                if len(unique_values) > 1:
-                    raise ValueError(
-                        f"Column '{col}' has inconsistent values within group {group_name}."
-                    )
-                row[col] = unique_values[0]
-
-        # Process data
+            steps, step_offsets = utils.flatten_trajectories(df[step_column], dtype=None)
+            for keys, level, first_rows in zip(self.keys, levels, grouping.first_rows()):
+                if grid is not None:
+                    group_steps = np.tile(grid, len(first_rows)), np.arange(len(first_rows) + 1) * len(grid)
+                else:
+                    group_steps = utils.take_trajectories(steps, step_offsets, first_rows)
+                keys.insert(len(level), step_column, utils.to_list_column(*group_steps))
+
+        # moments[column][level][length]: moments of all groups of the level over their runs of the length
+        self.moments = {}
         for data_col in value_columns:
-            data = np.vstack(group[data_col].values)
-            stats = utils.calculate_list_statistics(data)
-            for stat_name, stat_values in stats.items():
-                row[f"{data_col}_{stat_name}"] = stat_values
-        results.append(row)
+            values, offsets = _trajectories(df, data_col, step_column, grid)
+            lengths = utils.trajectory_lengths(offsets)
+            grouping.check_lengths(lengths, data_col)
+            self.moments[data_col] = [{} for _ in levels]
+            for length in np.unique(lengths[grouping.valid]):
+                runs = np.flatnonzero(grouping.valid & (lengths == length))
+                arrays = utils.take_trajectories(values, offsets, runs)[0].reshape(len(runs), length)
+                for level_moments, codes, n_groups in zip(self.moments[data_col], grouping.codes, grouping.n_groups):
+                    level_moments[length] = utils.grouped_moments(arrays, codes[runs], n_groups)
 
-    if output_name != '':
-        directory = save_directory / 'dataframes/'
-        Path.mkdir(directory, parents=True, exist_ok=True)
-        pd.DataFrame(results).to_feather(directory / f'{dataset}_{output_name}_process_summaries.feather')
 
-    return pd.DataFrame(results)
+def _merge_partition_moments(load, partitions: list, levels: list, partition_moments: list, value_columns: list,
+                             step_column=None, additional_columns=None, memory_budget=None, grid=None) -> list:
+    """
+    Summaries of levels spanning several partitions from the moments of the partitions (see `_PartitionMoments`);
+    medians are computed by loading the value columns of the partitions again, one block of steps at a time.
+    """
+    results = []
+    for j, level in enumerate(levels):
+        keys = pd.concat([moments.keys[j] for moments in partition_moments], ignore_index=True)
+        grouped = keys.groupby(level, observed=True)
+        codes = grouped.ngroup().to_numpy()
+        result = _group_keys(grouped, level, [col for col in additional_columns or [] if col not in level])
+        if step_column:
+            first_rows = np.unique(codes, return_index=True)[1]
+            result.insert(len(level), step_column, keys[step_column].take(first_rows).reset_index(drop=True))
+        # merged group of the groups of every partition
+        partition_codes = np.split(codes, np.cumsum([len(moments.keys[j]) for moments in partition_moments])[:-1])
+
+        for data_col in value_columns:
+            stats = {stat_name: np.empty(len(result), dtype=object) for stat_name in statistic_names}
+            group_lengths = np.full(len(result), -1)
+            n_runs = 0
+            for length in sorted({length for moments in partition_moments for length in moments.moments[data_col][j]}):
+                parts = [(moments.moments[data_col][j][length], group_codes)
+                         for moments, group_codes in zip(partition_moments, partition_codes)
+                         if length in moments.moments[data_col][j]]
+                merged = utils.merge_moments({name: np.concatenate([part[name] for part, _ in parts])
+                                              for name in parts[0][0]},
+                                             np.concatenate([group_codes for _, group_codes in parts]), len(result))
+                groups = np.flatnonzero(merged['count'] > 0)
+                if (group_lengths[groups] >= 0).any():
+                    raise ValueError(f"Column '{data_col}' has trajectories of different lengths within a group.")
+                group_lengths[groups] = length
+                n_runs += merged['count'].sum()
+                for stat_name, values in utils.moments_to_statistics(merged, ddof=0).items():
+                    for group in groups:
+                        stats[stat_name][group] = values[group]
+
+            stats['median'] = _partitioned_medians(load, partitions, levels, j, data_col, partition_codes,
+                                                   group_lengths, n_runs, memory_budget, step_column, grid)
+            stat_offsets = np.zeros(len(result) + 1, dtype=np.int64)
+            np.cumsum(np.maximum(group_lengths, 0), out=stat_offsets[1:])
+            for stat_name in statistic_names:
+                rows = [row for row in stats[stat_name] if row is not None]
+                stat_values = np.concatenate(rows) if rows else np.empty(0)
+                result[f"{data_col}_{stat_name}"] = utils.to_list_column(stat_values, stat_offsets)
+        results.append(result)
+    return results
+
+
+def _partitioned_medians(load, partitions: list, levels: list, j: int, data_col: str, partition_codes: list,
+                         group_lengths: np.ndarray, n_runs: int, memory_budget=None, step_column=None,
+                         grid=None) -> np.ndarray:
+    """
+    Medians per step of the groups of level `j` spanning several partitions. Every pass loads `data_col` of one
+    partition after the other and keeps the values of a block of steps of all `n_runs` runs, as wide as
+    `memory_budget` allows. With a `grid`, the runs are aligned to this common grid of steps first.
+    """
+    medians = np.empty(len(group_lengths), dtype=object)
+    for group in np.flatnonzero(group_lengths >= 0):
+        medians[group] = np.empty(group_lengths[group])
+    if (group_lengths < 0).all():
+        return medians
+
+    max_length = group_lengths.max()
+    block = max_length
+    if memory_budget is not None:
+        block = int(min(max(memory_budget // (8 * max(n_runs, 1)), 1), max_length))
+    columns = list(dict.fromkeys([col for level in levels for col in level] + [data_col]
+                                 + ([step_column] if grid is not None else [])))
+    for start in range(0, max_length, block):
+        # values of the block per block width (shorter at the end of trajectories)
+        blocks = {}
+        for partition, group_codes in zip(partitions, partition_codes):
+            df = load(partition, columns)
+            grouping = _LevelGrouping(df, levels)
+            values, offsets = _trajectories(df, data_col, step_column, grid)
+            lengths = utils.trajectory_lengths(offsets)
+            for length in np.unique(lengths[grouping.valid & (lengths > start)]):
+                runs = np.flatnonzero(grouping.valid & (lengths == length))
+                arrays = utils.take_trajectories(values, offsets, runs)[0].reshape(len(runs), length)
+                width = min(block, length - start)
+                blocks.setdefault(width, []).append((arrays[:, start:start + width].copy(),
+                                                     group_codes[grouping.codes[j][runs]]))
+            del df, values
+        for width, parts in blocks.items():
+            codes = np.concatenate([codes for _, codes in parts])
+            block_medians = utils.grouped_medians(np.concatenate([arrays for arrays, _ in parts]), codes,
+                                                  len(group_lengths))
+            for group in np.unique(codes):
+                medians[group][start:start + width] = block_medians[group]
+    return medians
+
+
+def _trajectories(df: pd.DataFrame, data_col: str, step_column=None, grid=None) -> tuple:
+    """Flat values and offsets of the trajectories of `data_col`, aligned to `grid` if given."""
+    values, offsets = utils.flatten_trajectories(df[data_col])
+    if grid is not None:
+        steps, step_offsets = utils.flatten_trajectories(df[step_column], dtype=None)
+        values = utils.align_trajectories(steps, step_offsets, values, offsets, grid).ravel()
+        offsets = np.arange(len(offsets)) * len(grid)
+    return values, offsets
+
+
+def _partitions_grid(load, partitions: list, levels: list, spanning_levels: list, step_column: str, spacing: str,
+                     n_points=None):
+    """
+    Common grid of steps of the runs of all partitions like `_common_grid`, if the steps of any run differ from those
+    of the first run of its group, within a partition or, for the `spanning_levels`, between partitions; None if all
+    steps agree. Only loads the grouping and step columns, one partition at a time.
+    """
+    columns = list(dict.fromkeys([col for level in levels for col in level] + [step_column]))
+    differ = False
+    # steps of the first run of every group of the spanning levels, by level and group
+    references = [{} for _ in spanning_levels]
+    first_steps, last_steps, max_length = [], [], 0
+    for partition in partitions:
+        df = load(partition, columns)
+        steps, offsets = utils.flatten_trajectories(df[step_column], dtype=None)
+        lengths = utils.trajectory_lengths(offsets)
+        grouping = _LevelGrouping(df, levels)
+        runs = grouping.valid & (lengths > 0)
+        first_steps.append(steps[offsets[:-1][runs]])
+        last_steps.append(steps[offsets[1:][runs] - 1])
+        max_length = max(max_length, int(lengths.max(initial=0)))
+
+        differ = differ or grouping.steps_differ(steps, offsets)
+        if not differ and spanning_levels:
+            spanning = _LevelGrouping(df, spanning_levels)
+            for level_references, grouped, first_rows in zip(references, spanning.groupings, spanning.first_rows()):
+                for group, row in zip(grouped.size().index, first_rows):
+                    group_steps = steps[offsets[row]:offsets[row + 1]]
+                    reference = level_references.setdefault(group, group_steps)
+                    differ = differ or not np.array_equal(reference, group_steps)
+        del df
+
+    first_steps, last_steps = np.concatenate(first_steps or [[]]), np.concatenate(last_steps or [[]])
+    if not differ:
+        return None
+    if len(first_steps) == 0:
+        return np.zeros(0, dtype=first_steps.dtype)
+    return utils.step_grid(first_steps.max().item(), last_steps.max().item(), n_points or max_length, spacing)
+
+
+def _common_grid(steps: np.ndarray, offsets: np.ndarray, runs: np.ndarray, spacing: str, n_points=None) -> np.ndarray:
+    """Grid of steps covered by all selected `runs` with steps, from their latest first step to their last step."""
+    lengths = utils.trajectory_lengths(offsets)
+    runs = runs & (lengths > 0)
+    if not runs.any():
+        return np.zeros(0, dtype=steps.dtype)
+    first_steps = steps[offsets[:-1][runs]]
+    last_steps = steps[offsets[1:][runs] - 1]
+    return utils.step_grid(first_steps.max().item(), last_steps.max().item(), n_points or int(lengths.max()), spacing)
+
+
+def _group_keys(grouped, config_columns, additional_columns=None) -> pd.DataFrame:
+    """
+    One row per (observed) group with the values of the grouping columns and of the additional columns, which
+    have to be consistent within each group.
+    """
+    keys = grouped.size().index
+    results = pd.DataFrame({col: np.asarray(keys.get_level_values(i)) for i, col in enumerate(config_columns)})
+    for col in additional_columns or []:
+        counts = grouped[col].nunique(dropna=False).to_numpy()
+        if (counts > 1).any():
+            group_name = keys[np.argmax(counts > 1)]
+            raise ValueError(f"Column '{col}' has inconsistent values within group {group_name}.")
+        results[col] = np.asarray(grouped[col].first())
+    return results
@@ -1,14 +1,23 @@
 """
 Specific functions to convert results from exploration mechanism experiments to dataframe with all informaiton.
 """
+from functools import lru_cache
 from pathlib import Path
 import sys
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 import utils
 
+__all__ = ["config_labels", "config_dict", "common_labels", "log_fields", "trajectory_dict", "group1", "group2",
+           "group3", "group4", "group5", "PSO_labels", "SHADE_labels", "PSO_RR_labels", "PSO_GPGM_labels",
+           "PSO_NPGM_labels", "PSO_PDM_labels", "PSO_SRM_labels", "parameter_dict", "algorithm_schemas",
+           "function_groups", "config_positions", "parse_config_names", "dict_to_df", "merge_runs", "read_optima",
+           "add_dist_to_opt", "log_distance_to_optimum", "add_final_distance", "add_final_aocc"]
+
 # Labels for optimisation problem information
 config_labels = [
     'Run',
@@ -36,6 +45,23 @@ common_labels = [
     'MinimumIndividualDistance',
 ]
 
+# Logged fields read from the .cbor files and their value types
+log_fields = {
+    'mahf::state::common::Iterations': np.int64,
+    'mahf::state::common::Evaluations': np.int64,
+    'BestObjectiveValue': np.float64,
+    'mahf::components::measures::diversity::MinimumIndividualDistance': np.float64,
+}
+
+# Value types of the logged data, stored as Arrow list columns
+trajectory_dict = {
+    'Iterations': np.int64,
+    'Evaluations': np.int64,
+    'BestObjectiveValue': np.float64,
+    'MinimumIndividualDistance': np.float64,
+    'DistanceToOptimum': np.float64,
+}
+
 # BBOB function groups
 group1 = ['f001', 'f002', 'f003', 'f004', 'f005']
 group2 = ['f006', 'f007', 'f008', 'f009']
@@ -110,150 +136,205 @@ PSO_SRM_labels = [
 ]
 
 
+# Types of the algorithm parameters: continuous parameters stay float64 so that values like 0.7 are kept exactly,
+# counts become int32 and named options categorical
+parameter_dict = {
+    'InertiaWeight': 'float64',
+    'C1': 'float64',
+    'C2': 'float64',
+    'YValue': 'float64',
+    'PMin': 'float64',
+    'ArchiveSize': 'int32',
+    'HistorySize': 'int32',
+    'FValue': 'float64',
+    'Crossover': 'float64',
+    'Threshold': 'float64',
+    'ThresholdParameter': 'category',
+    'NewPopulationSize': 'int32',
+    'Mu': 'float64',
+    'ReferenceSolution': 'category',
+    'Replacement': 'category',
+}
+
+# Parameters in the config names of every algorithm with their types, following the common config fields: adding an
+# algorithm only requires adding its parameters here (and their types to `parameter_dict`)
+algorithm_schemas = {
+    algorithm: {label: parameter_dict[label] for label in labels}
+    for algorithm, labels in [
+        ('PSO', PSO_labels),
+        ('SHADE', SHADE_labels),
+        ('PSO_RR', PSO_RR_labels),
+        ('PSO_GPGM', PSO_GPGM_labels),
+        ('PSO_NPGM', PSO_NPGM_labels),
+        ('PSO_PDM', PSO_PDM_labels),
+        ('PSO_SRM', PSO_SRM_labels),
+    ]
+}
+
+# BBOB function group of every function
+function_groups = {function: f'Group{i}' for i, group in enumerate([group1, group2, group3, group4, group5], start=1)
+                   for function in group}
+
+# Position of the common config fields in the config names, e.g. '1_bbob_f001_i01_d10_20_...' (Run, suite, Function,
+# Instance, Dimension, PopulationSize, followed by the parameters of the algorithm)
+config_positions = {'Run': 0, 'Function': 2, 'Instance': 3, 'Dimension': 4, 'PopulationSize': 5}
+
+
+def parse_config_names(names, algorithm: str) -> pd.DataFrame:
+    """
+    Parse the config names (file names of the logs) of all runs of an algorithm at once, splitting them into one
+    column per field of the algorithm's schema (see `algorithm_schemas`).
+    All names are split by one vectorised Arrow kernel; every field is cast to the type of its schema, fields with
+    few distinct values (and the config names) are dictionary-encoded once and emitted as categorical columns.
+
+    :param names: Config names, e.g. '1_bbob_f001_i01_d10_20_0.7_1.5_1.5'.
+    :param algorithm: Name of the algorithm.
+    :return: Dataframe with the columns 'Config', 'Algorithm', `config_labels` and the parameters of the algorithm.
+    """
+    if algorithm not in algorithm_schemas:
+        raise ValueError(f"Unknown algorithm '{algorithm}', expected one of {list(algorithm_schemas)}.")
+    parameters = algorithm_schemas[algorithm]
+    names = pa.array(list(names), type=pa.string())
+    fields = pc.split_pattern(pc.replace_substring_regex(names, r'\.cbor$', ''), '_')
+    n_fields = len(config_positions) + 1 + len(parameters)
+    short = pc.less(pc.list_value_length(fields), n_fields).to_numpy(zero_copy_only=False)
+    if short.any():
+        raise ValueError(f"Config name '{names[int(np.argmax(short))]}' has fewer than the {n_fields} fields of "
+                         f"{algorithm}.")
+
+    # i-th field of every name
+    starts = fields.offsets.to_numpy()[:-1]
+    flat_fields = fields.flatten()
+
+    def field(i: int) -> pa.Array:
+        return flat_fields.take(pa.array(starts + i))
+
+    columns = {'Config': _categorical(names), 'Algorithm': algorithm}
+    for label, position in config_positions.items():
+        columns[label] = _typed(field(position), config_dict[label], label)
+    functions = columns['Function']
+    columns['Group'] = pd.Categorical(functions.categories.map(function_groups))[functions.codes]
+    columns.update({label: _typed(field(len(config_positions) + 1 + i), dtype, label)
+                    for i, (label, dtype) in enumerate(parameters.items())})
+    return pd.DataFrame(columns, columns=['Config', 'Algorithm'] + config_labels + list(parameters)) \
+        .astype({'Algorithm': 'string'})
+
+
+def _typed(values: pa.Array, dtype: str, label: str):
+    """Values of a config field converted to `dtype` (a numpy type or 'category')."""
+    if dtype == 'category':
+        return _categorical(values)
+    try:
+        return pc.cast(values, pa.from_numpy_dtype(np.dtype(dtype))).to_numpy()
+    except pa.ArrowInvalid as error:
+        raise ValueError(f"Config field '{label}' cannot be converted to {dtype}: {error}") from None
+
+
+def _categorical(values: pa.Array) -> pd.Categorical:
+    """Categorical with sorted categories (like `astype('category')`) from one dictionary encoding of `values`."""
+    encoded = values.dictionary_encode()
+    categories = encoded.dictionary.to_numpy(zero_copy_only=False)
+    order = np.argsort(categories, kind='stable')
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    codes = ranks[encoded.indices.to_numpy(zero_copy_only=False)]
+    return pd.Categorical.from_codes(codes, categories[order])
+
+
 def dict_to_df(data_dict, algorithm) -> pd.DataFrame:
     """
-    Turn the dictionary of dataframes from experiments into one single dataframe, splitting the config
-    information into individual columns.
+    Turn the dictionary of dataframes (or of dicts of arrays, see utils.read_log_columns) from experiments into one
+    single dataframe, splitting the config information into individual columns (see `parse_config_names`).
     Labels are specified for exploration-mechanisms
     """
-    labels = ['Config'] + ['Algorithm'] + config_labels
-
-    if algorithm == 'PSO':
-        labels += PSO_labels
-    elif algorithm == 'SHADE':
-        labels += SHADE_labels
-    elif algorithm == 'PSO_RR':
-        labels += PSO_RR_labels
-    elif algorithm == 'PSO_GPGM':
-        labels += PSO_GPGM_labels
-    elif algorithm == 'PSO_NPGM':
-        labels += PSO_NPGM_labels
-    elif algorithm == 'PSO_PDM':
-        labels += PSO_PDM_labels
-    elif algorithm == 'PSO_SRM':
-        labels += PSO_SRM_labels
-
-    labels += common_labels
-
-    convert_dict = {
-        'Config': 'string',
-        'Algorithm': 'string',
+    df = parse_config_names(data_dict.keys(), algorithm)
+    logs = list(data_dict.values())
+    fields = {
+        'Iterations': 'mahf::state::common::Iterations',
+        'Evaluations': 'mahf::state::common::Evaluations',
+        'BestObjectiveValue': 'BestObjectiveValue',
+        'MinimumIndividualDistance': 'mahf::components::measures::diversity::MinimumIndividualDistance',
     }
-    convert_dict.update(config_dict)
-
-    df = pd.DataFrame(columns=labels)
-
-    for key, value in data_dict.items():
-        config = key.split('_')
-        entry = [key, algorithm, config[0], config[2], config[3], config[4]]
-        if config[2] in group1:
-            entry.append('Group1')
-        elif config[2] in group2:
-            entry.append('Group2')
-        elif config[2] in group3:
-            entry.append('Group3')
-        elif config[2] in group4:
-            entry.append('Group4')
-        elif config[2] in group5:
-            entry.append('Group5')
-        entry.append(config[5])
-        iterations = value['mahf::state::common::Iterations'].tolist()
-        corrected_iterations = [iterations[0]] + [i + 1 for i in iterations[1:]]
-        if algorithm == 'PSO':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8].removesuffix(".cbor"))
-        elif algorithm == 'SHADE':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10])
-            entry.append(config[11].removesuffix(".cbor"))
-        elif algorithm == 'PSO_RR':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10].removesuffix(".cbor"))
-        elif algorithm == 'PSO_GPGM':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10])
-            entry.append(config[11])
-            entry.append(config[12])
-            entry.append(config[13].removesuffix(".cbor"))
-        elif algorithm == 'PSO_NPGM':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10])
-            entry.append(config[11])
-            entry.append(config[12].removesuffix(".cbor"))
-        elif algorithm == 'PSO_PDM':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10])
-            entry.append(config[11])
-            entry.append(config[12])
-            entry.append(config[13].removesuffix(".cbor"))
-        elif algorithm == 'PSO_SRM':
-            entry.append(config[6])
-            entry.append(config[7])
-            entry.append(config[8])
-            entry.append(config[9])
-            entry.append(config[10])
-            entry.append(config[11])
-            entry.append(config[12])
-            entry.append(config[13].removesuffix(".cbor"))
-        entry.append(corrected_iterations)
-        entry.append(value['mahf::state::common::Evaluations'].tolist())
-        entry.append(value['BestObjectiveValue'].tolist())
-        entry.append(value['mahf::components::measures::diversity::MinimumIndividualDistance'].tolist())
-
-        df.loc[len(df)] = entry
-
-    df = df.astype(convert_dict)
+    for col in common_labels:
+        values, offsets = utils.flatten_trajectories(pd.Series([log[fields[col]] for log in logs], dtype=object),
+                                                     trajectory_dict[col])
+        if col == 'Iterations':
+            # the logged iterations start counting at 0 after the initialisation
+            lengths = utils.trajectory_lengths(offsets)
+            corrected = np.ones(len(values), dtype=values.dtype)
+            corrected[offsets[:-1][lengths > 0]] = 0
+            values = values + corrected
+        df[col] = utils.to_list_column(values, offsets, index=df.index)
 
     return df
 
 
+def merge_runs(df: pd.DataFrame, new_runs: pd.DataFrame, removed=()) -> pd.DataFrame:
+    """
+    Merge newly converted runs into a dataframe of already converted runs.
+    Runs in `df` whose config is also in `new_runs` are replaced, runs whose config is in `removed` are dropped.
+    The merged dataframe is sorted by config.
+    """
+    outdated = df['Config'].isin(new_runs['Config']) | df['Config'].isin(removed)
+    parts = [part for part in [df[~outdated], new_runs] if len(part) > 0]
+    merged = pd.concat(parts or [new_runs], ignore_index=True)
+    # categories of both parts differ, so concat falls back to object columns
+    merged = merged.astype({col: 'category' for col in df.select_dtypes('category').columns})
+    # the categories of loaded configs are not necessarily sorted, so sort by the names themselves
+    return merged.sort_values('Config', ignore_index=True, key=lambda configs: configs.astype(str))
+
+
+@lru_cache
+def read_optima(optima_path: Path) -> pd.Series:
+    """
+    Read the csv file with bbob function names and optimum values once and index the optima by
+    (Function, Instance, Dimension), e.g. ('f001', 'i01', 'd10').
+    """
+    optima = pd.read_csv(optima_path, header=None, names=['Name', 'Optimum'])
+    keys = optima['Name'].str.split('_', expand=True).iloc[:, 1:4]
+    keys.columns = ['Function', 'Instance', 'Dimension']
+    return pd.Series(optima['Optimum'].to_numpy(), index=pd.MultiIndex.from_frame(keys), name='Optimum')
+
+
 def add_dist_to_opt(df: pd.DataFrame, dataset_directory, functions=None):
     """
-    Add a column for the distance to the actual optimum for the BBOB function-instance combinations included in a list.
-    If no list is provided, all function-instance combinations are used.
+    Add a column for the distance to the actual optimum for the BBOB function-instance combinations included in a list
+    (e.g. ['f001_i01', 'f002_i01']). If no list is provided, all function-instance combinations are used.
     Requires a csv file with bbob function name and optimum values.
+    Runs without a matching optimum get None.
     """
-    optima_path = dataset_directory / 'bbob_optima.csv'
-    optima = pd.read_csv(optima_path, header=None, names=['Function', 'Optimum'])
-    if functions is None:
-        all_functions = optima['Function'].str.split('_')
-        function_list = ['_'.join([all_functions[x][1]] + [all_functions[x][2]]) for x in range(0, len(all_functions))]
-        function_list = list(set(function_list))
-        df['DistanceToOptimum'] = df.apply(calculate_difference, axis=1, df2=optima, function_list=function_list)
-        df['DistanceToOptimum'] = df['DistanceToOptimum'].apply(lambda arr: np.where(arr <= 0.0, sys.float_info.epsilon, arr))
-    else:
-        df['DistanceToOptimum'] = df.apply(calculate_difference, axis=1, df2=optima, function_list=functions)
-        df['DistanceToOptimum'] = df['DistanceToOptimum'].apply(lambda arr: np.where(arr <= 0.0, sys.float_info.epsilon, arr))
+    optima = read_optima(Path(dataset_directory) / 'bbob_optima.csv')
+    keys = pd.MultiIndex.from_arrays([df[col].astype(str) for col in ['Function', 'Instance', 'Dimension']])
+    optimum = optima.reindex(keys).to_numpy()
+    if functions is not None:
+        selected = (df['Function'].astype(str) + '_' + df['Instance'].astype(str)).isin(functions).to_numpy()
+        optimum = np.where(selected, optimum, np.nan)
+    missing = np.isnan(optimum)
+
+    values, offsets = utils.flatten_trajectories(df['BestObjectiveValue'])
+    distance = values - np.repeat(optimum, utils.trajectory_lengths(offsets))
+    distance = np.where(distance <= 0.0, sys.float_info.epsilon, distance)
+    df['DistanceToOptimum'] = utils.to_list_column(distance, offsets, index=df.index, missing=missing)
 
     # Drop column after calculating DistanceToOptimum as we (hopefully) don't need it anymore
     df.drop(columns=['BestObjectiveValue'])
 
 
-def calculate_difference(df1, df2, function_list):
-    """ (Note: This function was created with the help of ChatGPT-4o.) """
-    for name in function_list:
-        if name in df1['Config']:
-            matching_rows = df2[df2['Function'].str.contains(name, na=False)]
+def log_distance_to_optimum(name: str, columns: dict, optima: pd.Series) -> dict:
+    """
+    Add the distance to the optimum to the columns of a single log (see `utils.read_log_columns`), like
+    `add_dist_to_opt` for a dataframe; e.g. as transform of `utils.accumulate_log_files_with_joblib`.
 
-            if not matching_rows.empty:
-                return df1['BestObjectiveValue'] - matching_rows['Optimum'].values[0]
-    return None
+    :param name: File name of the log, e.g. '1_bbob_f001_i01_d10_...', specifying function, instance and dimension.
+    :param columns: Dict of the logged arrays, including 'BestObjectiveValue'.
+    :param optima: Optima as returned by `read_optima`.
+    :return: The columns with 'DistanceToOptimum' (NaN if there is no matching optimum).
+    """
+    config = name.split('_')
+    optimum = optima.get((config[2], config[3], config[4]), np.nan)
+    distance = columns['BestObjectiveValue'] - optimum
+    columns['DistanceToOptimum'] = np.where(distance <= 0.0, sys.float_info.epsilon, distance)
+    return columns
 
 
 def add_final_distance(df: pd.DataFrame):
@@ -261,18 +342,21 @@ def add_final_distance(df: pd.DataFrame):
     Add a column for the final distance to the optimum (requires column 'DistanceToOptimum').
     """
     assert 'DistanceToOptimum' in df, 'Cannot add final distance: Column DistanceToOptimum is missing!'
-    df['FinalDistance'] = df['DistanceToOptimum'].str[-1]
+    df['FinalDistance'] = utils.last_values(*utils.flatten_trajectories(df['DistanceToOptimum']))
 
 
-def add_final_aocc(df: pd.DataFrame):
+def add_final_aocc(df: pd.DataFrame, columns=None, lb: float = 0.00000001, ub: float = 100000000.0):
     """
     Add a column for the overall AOCC value of the run.
+    By default, the AOCC of 'DistanceToOptimum' is stored in 'AOCC'. Other trajectory columns can be given as list
+    (stored in '<column>_AOCC') or as dict mapping each column to the name of its AOCC column.
     """
-    assert 'DistanceToOptimum' in df, 'Cannot add AOCC: Column DistanceToOptimum is missing!'
-    aocc_data = df[['DistanceToOptimum']].apply(lambda x: x['DistanceToOptimum'], axis=1, result_type='expand')
-    transposed = aocc_data.T
-    aocc_values = lambda x: utils.aocc(x)
-    transposed = transposed.apply(aocc_values)
-    aocc_data = transposed.T
-    df['AOCC'] = aocc_data
-
+    if columns is None:
+        columns = {'DistanceToOptimum': 'AOCC'}
+    elif not isinstance(columns, dict):
+        columns = {col: f'{col}_AOCC' for col in columns}
+
+    for col, aocc_col in columns.items():
+        assert col in df, f'Cannot add AOCC: Column {col} is missing!'
+        values, offsets = utils.flatten_trajectories(df[col])
+        df[aocc_col] = utils.aocc_batch(values, offsets, lb, ub)
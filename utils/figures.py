@@ -1,13 +1,23 @@
+import itertools
+import warnings
 from pathlib import Path
 from typing import Optional
 
+import matplotlib
 import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
 from matplotlib.lines import Line2D
 from tqdm import tqdm
 
+import utils
+
+__all__ = ["setup_figs", "setup_figs_descriptive", "themes", "use_theme", "RenderQueue", "decimate",
+           "setup_figs_latex", "plot_descriptive_lineplots", "plot_descriptive_summarised_lineplots", "plot_twinaxes",
+           "plot_rank_tests"]
+
 
 # TODO see is and how figures can be set up better
 def setup_figs(fig_size: (float, float) = (6.4, 4.8), font_scale: float = 1.6, fig_scale: float = 1.3):
@@ -33,6 +43,7 @@ def setup_figs_descriptive():
                   palette='colorblind',
                   rc={
                       "lines.linewidth": 1,
+                      "figure.figsize": (6.4, 4.8),
                       "pdf.fonttype": 42,
                       "ps.fonttype": 42
                   })
@@ -41,7 +52,139 @@ def setup_figs_descriptive():
     plt.rcParams['font.serif'] = ['Times New Roman'] + plt.rcParams['font.serif']
     plt.rcParams['figure.dpi'] = 200
 
-    plt.tight_layout()
+
+# Themes of the plots (setup functions applied in order)
+themes = {
+    'descriptive': (setup_figs_descriptive,),
+    'summarised': (setup_figs_descriptive, setup_figs),
+}
+_active_theme = None
+
+
+def use_theme(name: str) -> None:
+    """
+    Applies one of the `themes`. Resetting the theme for every plot is expensive, so it is only applied if it is not
+    the active theme already.
+    """
+    global _active_theme
+    if name != _active_theme:
+        for setup in themes[name]:
+            setup()
+        _active_theme = name
+
+
+class RenderQueue:
+    """
+    Collects plots as specs (plot function and its arguments) and renders them in a pool of worker processes.
+    Each worker uses the Agg backend and applies each theme once (see `use_theme`); the plot functions reuse the
+    figure of the worker (see `_figure`). Every plot writes its own files, so the output does not depend on the order
+    in which the plots are rendered.
+    """
+
+    def __init__(self):
+        self.specs = []
+
+    def add(self, plot_function, *args, **kwargs) -> None:
+        self.specs.append((plot_function, args, kwargs))
+
+    def render(self, n_jobs: int = -1) -> None:
+        """Renders and removes all queued plots, using `n_jobs` worker processes (-1: all CPUs)."""
+        specs, self.specs = self.specs, []
+        Parallel(n_jobs=n_jobs, batch_size='auto')(delayed(_render)(spec) for spec in specs)
+
+
+def _render(spec) -> None:
+    if matplotlib.get_backend().lower() != 'agg':
+        plt.switch_backend('agg')
+    plot_function, args, kwargs = spec
+    plot_function(*args, **kwargs)
+
+
+def _figure(fig_size: (float, float) = None) -> plt.Figure:
+    """
+    Returns the figure for the next plot: the current figure is cleared and reused instead of creating a new one.
+
+    :param fig_size: Size of the figure, defaults to the figure size of the theme.
+    """
+    fig = plt.gcf()
+    fig.clf()
+    fig.set_size_inches(fig_size or plt.rcParams['figure.figsize'])
+    return fig
+
+
+def decimate(x, *ys, n_points: int = None, method: str = 'lttb') -> np.ndarray:
+    """
+    Selects the points of series sharing the x values `x` to draw, reducing them to about `n_points` points without
+    losing visual extrema: the points are split into buckets, and in each bucket the minimum and maximum of every
+    series are kept in addition to the point selected by the method.
+
+    :param x: X values (e.g. evaluations), sorted.
+    :param ys: Y values of the series.
+    :param n_points: Number of points to keep, defaults to the width of the figure in pixels.
+    :param method: 'lttb' (Largest-Triangle-Three-Buckets on the first series), 'log' (log-spaced resampling on the x
+        axis) or None (keep all points).
+    :return: Sorted indices of the points to draw.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ys = [np.asarray(y, dtype=np.float64) for y in ys]
+    if n_points is None:
+        n_points = int(plt.rcParams['figure.figsize'][0] * plt.rcParams['figure.dpi'])
+    if method is None or len(x) <= n_points or len(x) < 3:
+        return np.arange(len(x))
+
+    # the first and last point are always kept, the remaining budget is shared with the extrema of the series
+    n_buckets = max(1, min(len(x) - 2, (n_points - 2) // (1 + 2 * len(ys))))
+    if method == 'lttb':
+        edges = np.linspace(1, len(x) - 1, n_buckets + 1).astype(np.int64)
+        selected = _lttb(x, ys[0], edges) if ys else edges[:-1]
+    elif method == 'log':
+        # log spacing of the distance to the first point, so it works for any start of the x axis
+        targets = x[0] - 1 + np.geomspace(1, x[-1] - x[0] + 1, n_buckets + 1)
+        edges = np.unique(np.clip(np.searchsorted(x, targets), 1, len(x) - 1))
+        selected = edges[:-1]
+    else:
+        raise ValueError(f"Unknown decimation method '{method}', use 'lttb', 'log' or None.")
+
+    extrema = [_bucket_extrema(y, edges) for y in ys]
+    return np.unique(np.concatenate([[0, len(x) - 1], selected] + extrema))
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: selects the point of each bucket that forms the largest triangle with the point
+    selected in the previous bucket and the average of the next bucket.
+    """
+    selected = np.empty(len(edges) - 1, dtype=np.int64)
+    previous = 0
+    for b in range(len(edges) - 1):
+        start, end = edges[b], edges[b + 1]
+        next_end = edges[b + 2] if b + 2 < len(edges) else len(x)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            next_x, next_y = x[end:next_end].mean(), np.nanmean(y[end:next_end])
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[b] = previous
+    return selected
+
+
+def _bucket_extrema(y: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Indices of the minimum and maximum of `y` in every bucket between `edges` (ignoring missing values)."""
+    counts = np.diff(edges)
+    buckets = np.repeat(np.arange(len(counts)), counts)
+    values = y[edges[0]:edges[-1]]
+    extrema = []
+    for reduce in (np.fmin, np.fmax):
+        # first point of each bucket that equals the extremum of the bucket
+        matches = np.flatnonzero(values == np.repeat(reduce.reduceat(values, edges[:-1] - edges[0]), counts))
+        extrema.append(matches[np.unique(buckets[matches], return_index=True)[1]])
+    return edges[0] + np.concatenate(extrema)
+
+
+def _pixel_width(fig: plt.Figure) -> int:
+    """Width of the figure in pixels, the budget of points per series."""
+    return int(fig.get_figwidth() * fig.dpi)
 
 
 def setup_figs_latex():
@@ -69,7 +212,7 @@ def _save_or_show(save: Optional[str | Path] = None) -> None:
     plt.tight_layout()
     if save is not None:
         plt.savefig(save, bbox_inches='tight', pad_inches=0)
-        plt.close()
+        plt.clf()
     else:
         plt.show()
 
@@ -77,45 +220,122 @@ def _save_or_show(save: Optional[str | Path] = None) -> None:
 # ---
 # General descriptive plots
 # ---
-def plot_descriptive_lineplots(df, x_col, y_col, hue, style, save):
-    setup_figs_descriptive()
-    sns.lineplot(df, x=x_col, y=y_col, hue=hue, style=style)
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0)
-    _save_or_show(f'{save}_{x_col}_{y_col}')
+def plot_descriptive_lineplots(df, x_col, y_col, hue, style, save, errorbar: str = None, n_boot: int = 1000,
+                               decimation: str = 'lttb'):
+    """
+    Plots one line per hue (and style) group of the runs in `df`, which has one row per run with the trajectories in
+    `x_col` and `y_col`. Lines of groups with several runs show the mean and optional error bars (see
+    `utils.step_statistics`). The distance to the optimum is saved with linear and log scale, both drawn from the
+    same aggregated lines. Long lines are reduced to the pixel width of the figure (see `decimate`).
+    """
+    use_theme('descriptive')
+    lines = _aggregate_lines(df, x_col, y_col, hue, style, errorbar, n_boot)
+    fig = _figure()
+    ax = fig.subplots()
+    for label, color, linestyle, x, mean, lower, upper in lines:
+        keep = decimate(x, *(y for y in (mean, lower, upper) if y is not None), n_points=_pixel_width(fig),
+                        method=decimation)
+        ax.plot(x[keep], mean[keep], color=color, linestyle=linestyle, label=label)
+        if lower is not None:
+            ax.fill_between(x[keep], lower[keep], upper[keep], color=color, alpha=.2, linewidth=0)
+    ax.set(xlabel=x_col, ylabel=y_col)
+    if hue is not None or style is not None:
+        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0)
     if (y_col == 'DistanceToOptimum') | (y_col == 'DistanceToOptimum_mean'):
-        ax = sns.lineplot(df, x=x_col, y=y_col, hue=hue, style=style)
+        plt.tight_layout()
+        plt.savefig(f'{save}_{x_col}_{y_col}', bbox_inches='tight', pad_inches=0)
         ax.set(yscale='log')
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0)
         _save_or_show(f'{save}_{x_col}_{y_col}_logscale')
+    else:
+        _save_or_show(f'{save}_{x_col}_{y_col}')
 
 
-def plot_descriptive_summarised_lineplots(df, x_col, y_col, std, save):
-    setup_figs_descriptive()
-    setup_figs()
+def _aggregate_lines(df, x_col, y_col, hue, style, errorbar, n_boot) -> list:
+    """
+    Aggregates the runs of every hue/style group, ordered like seaborn orders the levels.
+    Returns tuples of label, color, line style, steps, mean, lower and upper error bar.
+    """
+    steps, step_offsets = utils.flatten_trajectories(df[x_col])
+    values, offsets = utils.flatten_trajectories(df[y_col])
+    if not np.array_equal(step_offsets, offsets):
+        raise ValueError(f"Columns '{x_col}' and '{y_col}' have trajectories of different lengths.")
+
+    keys = [col for col in (hue, style) if col is not None]
+    levels = [_levels(df[col]) for col in keys]
+    if keys:
+        groups = {key if isinstance(key, tuple) else (key,): rows
+                  for key, rows in df.groupby(keys, observed=True, sort=False).indices.items()}
+    else:
+        groups = {(): np.arange(len(df))}
+
+    if hue is not None and pd.api.types.is_numeric_dtype(df[hue]) and len(levels[0]) > 1:
+        cmap = sns.color_palette('ch:', as_cmap=True)
+        low, high = min(levels[0]), max(levels[0])
+        colors = {level: cmap((level - low) / (high - low)) for level in levels[0]}
+    elif hue is not None:
+        colors = dict(zip(levels[0], sns.color_palette(n_colors=len(levels[0]))))
+    else:
+        colors = {}
+    linestyles = dict(zip(levels[-1], itertools.cycle(['-', '--', ':', '-.']))) if style is not None else {}
+
+    lines = []
+    for key in sorted(groups, key=lambda key: [level.index(value) for level, value in zip(levels, key)]):
+        x, mean, lower, upper = utils.step_statistics(*(utils.take_trajectories(buffer, offsets, groups[key])[0]
+                                                        for buffer in (steps, values)),
+                                                      errorbar=errorbar, n_boot=n_boot)
+        lines.append((', '.join(str(value) for value in key) or None,
+                      colors[key[0]] if hue is not None else None,
+                      linestyles[key[-1]] if style is not None else '-',
+                      x, mean, lower, upper))
+    return lines
+
+
+def _levels(column: pd.Series) -> list:
+    """Levels of a hue or style column: observed categories in order, sorted numbers or in order of appearance."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        observed = set(column.dropna())
+        return [category for category in column.cat.categories if category in observed]
+    values = list(pd.unique(column.dropna()))
+    return sorted(values) if pd.api.types.is_numeric_dtype(column) else values
+
+
+def plot_descriptive_summarised_lineplots(df, x_col, y_col, std, save, decimation: str = 'lttb'):
+    use_theme('summarised')
+    fig = _figure()
+    plus_std = df[y_col].to_numpy(dtype=float) + df[std].to_numpy(dtype=float)
+    minus_std = df[y_col].to_numpy(dtype=float) - df[std].to_numpy(dtype=float)
+    keep = decimate(df[x_col], df[y_col], plus_std, minus_std, n_points=_pixel_width(fig), method=decimation)
+    df, plus_std, minus_std = df.iloc[keep], plus_std[keep], minus_std[keep]
     sns.lineplot(x=df[x_col], y=df[y_col])
     if y_col in ['MinimumIndividualDistance_mean']:
         plt.ylim((-0.2, 1))
-    plus_std = df[y_col].to_numpy() + df[std].to_numpy()
-    minus_std = df[y_col].to_numpy() - df[std].to_numpy()
     sns.lineplot(x=df[x_col], y=plus_std, color='b')
     sns.lineplot(x=df[x_col], y=minus_std, color='b')
     plt.fill_between(df[x_col].astype(int), minus_std.astype(float), plus_std.astype(float), alpha=.3)
     _save_or_show(f'{save}_{x_col}_{y_col}')
 
 
-def plot_twinaxes(df, algorithms, x_col, hue, colors, save):
-    setup_figs_descriptive()
-    fig, ax1 = plt.subplots(figsize=(7, 6))
+def plot_twinaxes(df, algorithms, x_col, hue, colors, save, decimation: str = 'lttb'):
+    use_theme('descriptive')
+    fig = _figure((7, 6))
+    ax1 = fig.subplots()
     ax2 = ax1.twinx()
 
+    subsets = {}
     for algo in algorithms:
         subset = df[df[hue] == algo]
+        subsets[algo] = subset.iloc[decimate(subset[x_col], subset['MinimumIndividualDistance_mean'],
+                                             subset['DistanceToOptimum_mean'], n_points=_pixel_width(fig),
+                                             method=decimation)]
+
+    for algo in algorithms:
+        subset = subsets[algo]
         algo_color = colors[algo]
         ax1.plot(subset[x_col], subset['MinimumIndividualDistance_mean'], label=algo, linestyle='--', alpha=0.7, color=algo_color)
         ax1.fill_between(subset[x_col].astype(int), subset['MinimumIndividualDistance_mean'].astype(float), alpha=0.2, color=algo_color)
 
     for algo in algorithms:
-        subset = df[df["Algorithm"] == algo]
+        subset = subsets[algo]
         algo_color = colors[algo]
         ax2.plot(subset[x_col], subset['DistanceToOptimum_mean'], linewidth=2, alpha=0.9, color=algo_color)
 
@@ -130,3 +350,30 @@ def plot_twinaxes(df, algorithms, x_col, hue, colors, save):
 
     _save_or_show(f'{save}')
 
+
+def plot_rank_tests(p_values: pd.DataFrame, avg_ranks: pd.Series, colors: dict, title: Optional[str],
+                    save_signplot: str | Path, save_crd: str | Path):
+    """
+    Plots the results of a Friedman/Nemenyi test: the sign plot of the Nemenyi p-values and the critical difference
+    diagram of the average ranks.
+    """
+    # scikit-posthocs (and its statsmodels backend) is only needed here, so it is not imported with the figures
+    import scikit_posthocs as sp
+
+    use_theme('descriptive')
+    _figure((8, 8))
+    cmap = ["1"] + sns.color_palette("flare", n_colors=4)
+    heatmap_args = {'cmap': cmap, 'linewidths': 0.25, 'linecolor': '0.5', 'clip_on': False, 'square': True}
+    sp.sign_plot(p_values, **heatmap_args)
+    plt.savefig(save_signplot, bbox_inches='tight', pad_inches=0)
+
+    _figure((8, 2))
+    if title is not None:
+        plt.title(title)
+    sp.critical_difference_diagram(
+        avg_ranks,  # Average ranks of algorithms
+        p_values,  # Use the p-values from the Nemenyi test
+        color_palette=colors,
+    )
+    plt.savefig(save_crd, bbox_inches='tight', pad_inches=0)
+    plt.clf()
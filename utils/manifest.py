@@ -0,0 +1,89 @@
+"""
+Manifest of converted .cbor log files, so a rerun of the conversion only has to parse new or changed logs.
+For every log, the manifest records its path, size, modification time and content hash; the manifest also records
+the version of the conversion code, as logs converted by other code have to be converted again.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Union
+
+__all__ = ["file_hash", "files_fingerprint", "read_manifest", "write_manifest", "scan_log_dir"]
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(file_path: Union[Path, str], chunk_size: int = 1 << 20) -> str:
+    """Content hash (BLAKE2b) of the file in `file_path`."""
+    digest = hashlib.blake2b(digest_size=16)
+    with Path(file_path).open('rb') as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def files_fingerprint(paths, root: Union[Path, str] = None) -> str:
+    """Fingerprint of the files in `paths` from their names (relative to `root`), sizes and modification times."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(Path(path) for path in paths):
+        stat = path.stat()
+        name = path.relative_to(root) if root is not None else path
+        digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def read_manifest(manifest_path: Union[Path, str], code_version: str = None) -> dict:
+    """
+    Read the manifest in `manifest_path`; returns an empty manifest if there is none, it is outdated or it was
+    written by other conversion code than `code_version` (e.g. `utils.code_fingerprint` of the conversion script).
+    """
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        return {}
+    with manifest_path.open() as fp:
+        manifest = json.load(fp)
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('code') != code_version:
+        return {}
+    return manifest['files']
+
+
+def write_manifest(manifest_path: Union[Path, str], manifest: dict, code_version: str = None):
+    """
+    Write the manifest and the version of the conversion code to `manifest_path`, replacing the old one only once it
+    is written completely.
+    """
+    manifest_path = Path(manifest_path)
+    temporary_path = manifest_path.with_suffix('.tmp')
+    with temporary_path.open('w') as fp:
+        json.dump({'version': MANIFEST_VERSION, 'code': code_version, 'files': manifest}, fp, indent=1,
+                  sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+
+def scan_log_dir(dir_path: Union[Path, str], manifest: dict) -> (list, list, dict):
+    """
+    Compare the .cbor logs in `dir_path` against the `manifest`.
+    Logs with unchanged size and modification time are trusted without hashing them; all other logs are hashed
+    and only count as changed if their content differs.
+
+    :param dir_path: Directory with the .cbor logs.
+    :param manifest: Manifest of the already converted logs (see `read_manifest`).
+    :return: Tuple of the paths of new or changed logs, the names of removed logs, and the updated manifest.
+    """
+    dir_path = Path(dir_path)
+    changed = []
+    updated = {}
+    for file in sorted(dir_path.glob("*.cbor")):
+        stat = file.stat()
+        record = {'path': str(file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        previous = manifest.get(file.stem)
+        if previous is not None and all(previous[key] == record[key] for key in ['path', 'size', 'mtime_ns']):
+            updated[file.stem] = previous
+            continue
+        record['hash'] = file_hash(file)
+        if previous is None or previous['hash'] != record['hash']:
+            changed.append(file)
+        updated[file.stem] = record
+    removed = sorted(set(manifest) - set(updated))
+    return changed, removed, updated
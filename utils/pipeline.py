@@ -0,0 +1,162 @@
+"""
+Dependency-aware runner of the steps of the analysis (conversion, analysis, comparison).
+Every step is a task with the tasks it depends on, a command and a fingerprint of its inputs. A task is only run if
+its inputs changed since its last successful run (or its outputs are missing); ready tasks run in parallel.
+"""
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Callable, Union
+
+from utils.manifest import file_hash
+
+__all__ = ["Task", "script_dependencies", "combine_fingerprints", "code_fingerprint", "read_state", "write_state",
+           "run_tasks"]
+
+STATE_VERSION = 1
+
+# Files (relative to the repository) whose content determines the outputs of every script besides the script itself:
+# the utils modules it uses, directly or through each other, and the datasets it reads
+script_dependencies = {
+    'convert_log_files.py': ['utils/__init__.py', 'utils/read_data.py', 'utils/manifest.py', 'utils/ragged.py',
+                             'utils/df_format.py', 'utils/calc_stats.py', 'datasets/bbob_optima.csv'],
+    'analysis.py': ['utils/__init__.py', 'utils/read_data.py', 'utils/manifest.py', 'utils/ragged.py',
+                    'utils/calc_stats.py', 'utils/descriptive_stats.py', 'utils/descriptive_plots.py',
+                    'utils/figures.py'],
+    'comparison.py': ['utils/__init__.py', 'utils/read_data.py', 'utils/manifest.py', 'utils/ragged.py',
+                      'utils/calc_stats.py', 'utils/rank_tests.py', 'utils/descriptive_plots.py', 'utils/figures.py'],
+}
+
+
+class Task:
+    """
+    Step of the pipeline.
+
+    :param name: Unique name of the task, e.g. 'analyse PSO d10'.
+    :param command: Command to run (list of arguments).
+    :param fingerprint: Function returning the fingerprint of the inputs of the task; it is called once all
+        dependencies have finished. None if the task has no inputs (it is then skipped if its outputs exist).
+    :param outputs: Paths that have to exist for the task to be up-to-date.
+    :param dependencies: Names of the tasks that have to finish first.
+    """
+
+    def __init__(self, name: str, command: list, fingerprint: Callable[[], Union[str, None]], outputs: list,
+                 dependencies: list = None):
+        self.name = name
+        self.command = [str(argument) for argument in command]
+        self.fingerprint = fingerprint
+        self.outputs = [Path(output) for output in outputs]
+        self.dependencies = list(dependencies or [])
+
+    def is_up_to_date(self, state: dict, fingerprint: Union[str, None]) -> bool:
+        """Whether the task ran successfully on inputs with `fingerprint` before and its outputs still exist."""
+        outputs_exist = all(output.exists() for output in self.outputs)
+        return outputs_exist and (fingerprint is None or state.get(self.name) == fingerprint)
+
+
+def combine_fingerprints(*fingerprints) -> str:
+    """Single fingerprint of several fingerprints (or other strings)."""
+    return hashlib.blake2b('\n'.join(map(str, fingerprints)).encode(), digest_size=16).hexdigest()
+
+
+def code_fingerprint(base_path: Union[Path, str], script: str) -> str:
+    """Fingerprint of the code of `script` (a path relative to `base_path`) and its `script_dependencies`."""
+    base_path = Path(base_path)
+    return combine_fingerprints(*[file_hash(base_path / path) for path in [script] + script_dependencies[script]])
+
+
+def read_state(state_path: Union[Path, str]) -> dict:
+    """Read the fingerprints of the last successful runs of the tasks; empty if there is no or an outdated state."""
+    state_path = Path(state_path)
+    if not state_path.exists():
+        return {}
+    with state_path.open() as fp:
+        state = json.load(fp)
+    if state.get('version') != STATE_VERSION:
+        return {}
+    return state['tasks']
+
+
+def write_state(state_path: Union[Path, str], state: dict):
+    """Write the fingerprints of the tasks to `state_path`, replacing the old state only once it is written."""
+    state_path = Path(state_path)
+    temporary_path = state_path.with_suffix('.tmp')
+    with temporary_path.open('w') as fp:
+        json.dump({'version': STATE_VERSION, 'tasks': state}, fp, indent=1, sort_keys=True)
+    os.replace(temporary_path, state_path)
+
+
+def run_tasks(tasks: list, state_path: Union[Path, str], n_parallel: int = 1, force: bool = False,
+              cwd: Union[Path, str] = None) -> (list, list, list):
+    """
+    Run the stale `tasks` in dependency order, up to `n_parallel` at once. Each task runs as its own process; the
+    fingerprint of a successful task is recorded in the state file right away, so an interrupted pipeline resumes
+    with the unfinished tasks. Tasks depending on a failed task are not run.
+
+    :param tasks: List of tasks.
+    :param state_path: Path of the state file with the fingerprints of the last successful runs.
+    :param n_parallel: Number of tasks to run at once.
+    :param force: Whether to run all tasks, even if they are up-to-date.
+    :param cwd: Working directory of the tasks.
+    :return: Tuple of the names of the tasks that were run, skipped as up-to-date, and failed (or not run because
+        a dependency failed).
+    """
+    names = {task.name for task in tasks}
+    for task in tasks:
+        unknown = set(task.dependencies) - names
+        if unknown:
+            raise ValueError(f"Task '{task.name}' depends on unknown tasks {sorted(unknown)}.")
+
+    state = read_state(state_path)
+    pending = {task.name: task for task in tasks}
+    finished, ran, skipped, failed = set(), [], [], []
+    with ThreadPoolExecutor(max(n_parallel, 1)) as pool:
+        running = {}
+        while pending or running:
+            # start all ready tasks; skipping an up-to-date task can make further tasks ready
+            progress = True
+            while progress:
+                progress = False
+                for name, task in list(pending.items()):
+                    if any(dependency in failed for dependency in task.dependencies):
+                        failed.append(name)
+                        del pending[name]
+                        progress = True
+                        print(f'[pipeline] not running {name}: a dependency failed')
+                    elif all(dependency in finished for dependency in task.dependencies):
+                        del pending[name]
+                        try:
+                            fingerprint = task.fingerprint()
+                        except (OSError, ValueError) as error:
+                            failed.append(name)
+                            progress = True
+                            print(f'[pipeline] not running {name}: cannot fingerprint its inputs ({error})')
+                            continue
+                        if not force and task.is_up_to_date(state, fingerprint):
+                            finished.add(name)
+                            skipped.append(name)
+                            progress = True
+                            print(f'[pipeline] {name} is up-to-date')
+                            continue
+                        print(f'[pipeline] running {name}: {" ".join(task.command)}')
+                        running[pool.submit(subprocess.run, task.command, cwd=cwd)] = (task, fingerprint)
+            if not running:
+                if pending:
+                    raise ValueError(f'Tasks {sorted(pending)} have cyclic dependencies.')
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, fingerprint = running.pop(future)
+                if future.result().returncode == 0:
+                    finished.add(task.name)
+                    ran.append(task.name)
+                    state[task.name] = fingerprint
+                    write_state(state_path, state)
+                else:
+                    failed.append(task.name)
+                    print(f'[pipeline] {task.name} failed with exit code {future.result().returncode}')
+    return ran, skipped, failed
@@ -0,0 +1,232 @@
+"""
+Instrumentation of the steps of the analysis: every stage (e.g. reading the logs or one summarise call) records its
+wall time, CPU time, peak RSS and number of rows. Once profiling is enabled (see `enable_profiling`, used by the
+`--trace` option of cli.py), the stages are written as JSON trace and summarised in a table at exit; otherwise
+`stage` does nothing, so the instrumented code can run unchanged, e.g. in worker processes.
+"""
+import atexit
+import cProfile
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Union
+
+import psutil
+
+__all__ = ["Stage", "StageProfiler", "stage", "enable_profiling", "profilers"]
+
+# Profilers that can be run in addition to the stage profiler
+profilers = ['cprofile', 'py-spy']
+
+
+class Stage:
+    """
+    Measurements of one stage. The number of rows (e.g. of the resulting dataframe) can be set by the instrumented
+    code, e.g. `with utils.stage('build frame') as s: df = ...; s.rows = len(df)`.
+    """
+
+    def __init__(self, name: str, parent: str = None, rows: int = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.rows = rows
+        self.attributes = attributes
+        self.start = None
+        self.wall_time = None
+        self.cpu_time = None
+        self.start_rss = None
+        self.peak_rss = None
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'parent': self.parent, 'start': self.start, 'wall_time': self.wall_time,
+                'cpu_time': self.cpu_time, 'peak_rss': self.peak_rss / 2 ** 20,
+                'rss_increase': (self.peak_rss - self.start_rss) / 2 ** 20, 'rows': self.rows,
+                'error': self.error, **self.attributes}
+
+
+class StageProfiler:
+    """
+    Records the stages of a process. CPU time and RSS include the child processes (e.g. joblib workers); the RSS is
+    sampled by a background thread every `interval` seconds while a stage is running, so shorter peaks may be missed.
+
+    :param interval: Sampling interval of the RSS in seconds.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.stages = []
+        self.start = time.perf_counter()
+        self._active = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def rss(self) -> int:
+        """Current RSS of this process and all its child processes in bytes."""
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def cpu_time(self) -> float:
+        """CPU time (user and system) of this process, its finished and its running child processes in seconds."""
+        times = self.process.cpu_times()
+        cpu_time = times.user + times.system + times.children_user + times.children_system
+        for child in self.process.children(recursive=True):
+            try:
+                child_times = child.cpu_times()
+            except psutil.Error:
+                continue
+            cpu_time += child_times.user + child_times.system
+        return cpu_time
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            rss = self.rss()
+            for record in active:
+                record.peak_rss = max(record.peak_rss, rss)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None, **attributes):
+        """
+        Measure the enclosed block as stage `name`; stages may be nested.
+
+        :param name: Name of the stage, e.g. 'summarise process stats'.
+        :param rows: Number of rows processed by the stage (can also be set on the yielded `Stage`).
+        :param attributes: Further information stored with the stage, e.g. the algorithm.
+        """
+        with self._lock:
+            parent = self._active[-1].name if self._active else None
+        record = Stage(name, parent, rows, **attributes)
+        record.start_rss = record.peak_rss = self.rss()
+        start_cpu = self.cpu_time()
+        record.start = time.perf_counter() - self.start
+        with self._lock:
+            self._active.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, daemon=True)
+                self._thread.start()
+        try:
+            yield record
+        except BaseException as error:
+            record.error = f'{type(error).__name__}: {error}'
+            raise
+        finally:
+            record.wall_time = time.perf_counter() - self.start - record.start
+            record.cpu_time = self.cpu_time() - start_cpu
+            record.peak_rss = max(record.peak_rss, self.rss())
+            with self._lock:
+                self._active.remove(record)
+                self.stages.append(record)
+
+    def write_trace(self, trace_path: Union[Path, str], **metadata):
+        """Write the recorded stages (in order of their start) and `metadata` as JSON to `trace_path`."""
+        trace_path = Path(trace_path)
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        stages = sorted(self.stages, key=lambda record: record.start)
+        with trace_path.open('w') as fp:
+            json.dump({**metadata, 'wall_time': time.perf_counter() - self.start,
+                       'stages': [record.to_dict() for record in stages]}, fp, indent=1)
+
+    def summary(self) -> str:
+        """Table of the total wall and CPU time, peak RSS and rows of every stage name, in order of first start."""
+        totals = {}
+        for record in sorted(self.stages, key=lambda record: record.start):
+            total = totals.setdefault(record.name, {'count': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': 0,
+                                                    'rows': None})
+            total['count'] += 1
+            total['wall_time'] += record.wall_time
+            total['cpu_time'] += record.cpu_time
+            total['peak_rss'] = max(total['peak_rss'], record.peak_rss)
+            if record.rows is not None:
+                total['rows'] = (total['rows'] or 0) + record.rows
+        width = max([len(name) for name in totals] + [5])
+        lines = [f'{"stage":<{width}} {"count":>6} {"wall [s]":>10} {"cpu [s]":>10} {"peak RSS [MiB]":>15} '
+                 f'{"rows":>10}']
+        for name, total in totals.items():
+            rows = '' if total['rows'] is None else total['rows']
+            lines.append(f'{name:<{width}} {total["count"]:>6} {total["wall_time"]:>10.2f} '
+                         f'{total["cpu_time"]:>10.2f} {total["peak_rss"] / 2 ** 20:>15.1f} {rows:>10}')
+        return '\n'.join(lines)
+
+
+# Profiler of this process, None while profiling is not enabled
+_profiler = None
+
+
+@contextmanager
+def stage(name: str, rows: int = None, **attributes):
+    """
+    Measure the enclosed block as stage `name` with the profiler of this process (see `StageProfiler.stage`); only
+    yields an unmeasured `Stage` if profiling is not enabled.
+    """
+    if _profiler is None:
+        yield Stage(name, rows=rows, **attributes)
+    else:
+        with _profiler.stage(name, rows, **attributes) as record:
+            yield record
+
+
+def enable_profiling(trace_path: Union[Path, str], profiler: str = None, **metadata) -> StageProfiler:
+    """
+    Record the stages of this process; at exit, the stages are written as JSON trace to `trace_path` and their
+    summary is printed.
+
+    :param trace_path: Path of the JSON trace.
+    :param profiler: Optional profiler of the whole process: 'cprofile' writes the statistics of cProfile next to the
+        trace (`<trace>.prof`, e.g. for pstats or snakeviz), 'py-spy' samples this process and its child processes
+        with py-spy (has to be installed) and writes a speedscope profile (`<trace>.speedscope.json`).
+    :param metadata: Information stored in the trace, e.g. the command.
+    :return: The stage profiler.
+    """
+    global _profiler
+    assert profiler is None or profiler in profilers, f'Unknown profiler {profiler}!'
+    trace_path = Path(trace_path)
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
+    _profiler = stage_profiler = StageProfiler()
+    metadata = {'argv': sys.argv, 'pid': os.getpid(), 'date': datetime.now().isoformat(timespec='seconds'),
+                **metadata}
+
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        metadata['profile'] = str(trace_path.with_suffix('.prof'))
+    elif profiler == 'py-spy':
+        executable = shutil.which('py-spy')
+        if executable is None:
+            raise ValueError('py-spy is not installed.')
+        metadata['profile'] = str(trace_path.with_suffix('.speedscope.json'))
+        sampler = subprocess.Popen([executable, 'record', '--pid', str(os.getpid()), '--subprocesses',
+                                    '--format', 'speedscope', '--output', metadata['profile']],
+                                   stdout=subprocess.DEVNULL)
+
+    def finish():
+        if profiler == 'cprofile':
+            profile.disable()
+            profile.dump_stats(metadata['profile'])
+        elif profiler == 'py-spy':
+            # py-spy writes its profile once it is interrupted
+            sampler.send_signal(signal.SIGINT)
+            sampler.wait()
+        stage_profiler.write_trace(trace_path, **metadata)
+        print(f'\nStages (trace written to {trace_path}):')
+        print(stage_profiler.summary())
+
+    atexit.register(finish)
+    return stage_profiler
@@ -0,0 +1,169 @@
+"""
+Helpers for trajectory columns, i.e. columns holding one sequence of logged values per run.
+For vectorised computations, such a column is handled as one flat values buffer plus an offsets buffer,
+where run i covers values[offsets[i]:offsets[i + 1]].
+In dataframes, trajectory columns are stored as Arrow list columns, which hold exactly these two buffers
+and can be written to and read from feather files without creating Python objects per value.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+__all__ = ["flatten_trajectories", "trajectory_lengths", "last_values", "take_trajectories", "step_grid",
+           "align_trajectories", "to_list_column", "list_types_mapper"]
+
+
+def trajectory_lengths(offsets: np.ndarray) -> np.ndarray:
+    """Number of logged values per run for the given offsets buffer."""
+    return np.diff(offsets)
+
+
+def flatten_trajectories(column: pd.Series, dtype=np.float64) -> (np.ndarray, np.ndarray):
+    """
+    Concatenate the trajectories of a column into one flat values buffer.
+
+    :param column: Series with one sequence (list or array) per row; missing sequences (None) count as empty.
+    :param dtype: Dtype of the values buffer (None keeps the dtype of the column).
+    :return: Tuple of the flat values buffer and the offsets buffer (length number of rows + 1).
+    """
+    if is_list_column(column):
+        return _flatten_list_column(column, dtype)
+    sequences = [np.asarray(() if sequence is None else sequence, dtype=dtype) for sequence in column]
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    values = np.concatenate(sequences) if sequences else np.empty(0, dtype=dtype)
+    return values, offsets
+
+
+def last_values(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Last value of every run in a flat values buffer. Keeps the dtype of the values if all runs have values,
+    otherwise runs without values get NaN.
+    """
+    lengths = trajectory_lengths(offsets)
+    if (lengths > 0).all():
+        return values[offsets[1:] - 1]
+    last = np.full(len(lengths), np.nan)
+    last[lengths > 0] = values[offsets[1:][lengths > 0] - 1]
+    return last
+
+
+def take_trajectories(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Select the trajectories of `rows` from a flat values buffer.
+
+    :return: Tuple of the values buffer and the offsets buffer of the selected runs.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = trajectory_lengths(offsets)[rows]
+    selected_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=selected_offsets[1:])
+    # position of every selected value in the original buffer
+    positions = np.repeat(offsets[:-1][rows] - selected_offsets[:-1], lengths) + np.arange(selected_offsets[-1])
+    return values[positions], selected_offsets
+
+
+@lru_cache(maxsize=64)
+def step_grid(start: float, stop: float, n_points: int, spacing: str = 'linear') -> np.ndarray:
+    """
+    Common grid of steps (e.g. evaluations) from `start` to `stop`, for aligning runs logged at different steps.
+    Grids are cached, so all columns and groups of a dataset share one (read-only) array.
+
+    :param start: First step.
+    :param stop: Last step.
+    :param n_points: Number of steps.
+    :param spacing: 'linear' or 'log' (log-spaced steps, denser at the start of the runs).
+    :return: Sorted array of unique steps; integer if start and stop are integers and the steps are whole numbers.
+    """
+    if spacing == 'linear':
+        grid = np.linspace(start, stop, n_points)
+    elif spacing == 'log':
+        assert start > 0, 'Log-spaced steps have to start above 0!'
+        grid = np.geomspace(start, stop, n_points)
+    else:
+        raise ValueError(f"Unknown spacing '{spacing}' of the step grid.")
+    if float(start).is_integer() and float(stop).is_integer():
+        grid = np.unique(np.round(grid).astype(np.int64))
+    grid.setflags(write=False)
+    return grid
+
+
+def align_trajectories(steps: np.ndarray, step_offsets: np.ndarray, values: np.ndarray, offsets: np.ndarray,
+                       grid: np.ndarray) -> np.ndarray:
+    """
+    Project the trajectories of all runs onto a common grid of steps, carrying the last observation forward: the
+    value of a run at a grid step is its last value logged at or before that step (NaN before its first value).
+    The positions of all grid steps in all runs are found with one searchsorted over the flat buffers.
+
+    :param steps: Flat buffer with the (increasing) steps of every run, e.g. the evaluations.
+    :param step_offsets: Offsets buffer of the steps.
+    :param values: Flat buffer with the values logged at these steps.
+    :param offsets: Offsets buffer of the values (same trajectory lengths as the steps).
+    :param grid: Sorted array of grid steps (see `step_grid`).
+    :return: 2-D array (runs x grid steps) with the aligned values.
+    """
+    lengths = trajectory_lengths(offsets)
+    if (trajectory_lengths(step_offsets) != lengths).any():
+        raise ValueError('Cannot align trajectories: steps and values have different lengths.')
+    n_runs = len(lengths)
+    if n_runs == 0 or len(steps) == 0:
+        return np.full((n_runs, len(grid)), np.nan)
+
+    # shift the steps of run i by i * span, so the steps of all runs form one increasing sequence
+    low = min(steps.min(), np.min(grid))
+    span = max(steps.max(), np.max(grid)) - low + 1
+    run_shifts = np.arange(n_runs) * span
+    shifted = steps - low + np.repeat(run_shifts, lengths)
+    queries = (np.asarray(grid) - low)[np.newaxis, :] + run_shifts[:, np.newaxis]
+    positions = np.searchsorted(shifted, queries.ravel(), side='right').reshape(n_runs, len(grid)) - 1
+
+    # positions before the first step of a run belong to the previous run
+    observed = positions >= step_offsets[:-1, np.newaxis]
+    aligned = np.full((n_runs, len(grid)), np.nan)
+    aligned[observed] = values[(positions - step_offsets[:-1, np.newaxis] + offsets[:-1, np.newaxis])[observed]]
+    return aligned
+
+
+def to_list_column(values: np.ndarray, offsets: np.ndarray, index=None, missing: np.ndarray = None) -> pd.Series:
+    """
+    Wrap a flat values buffer and its offsets as Arrow list column, without copying the values.
+
+    :param values: Flat values buffer.
+    :param offsets: Offsets buffer as returned by `flatten_trajectories`.
+    :param index: Index of the returned series.
+    :param missing: Optional boolean mask of runs to set to null.
+    :return: Series with dtype list<...>[pyarrow].
+    """
+    offsets = np.asarray(offsets)
+    list_type = pa.ListArray if offsets[-1] < np.iinfo(np.int32).max else pa.LargeListArray
+    offsets = pa.array(offsets.astype(np.int32 if list_type is pa.ListArray else np.int64))
+    mask = None if missing is None else pa.array(np.asarray(missing, dtype=bool))
+    array = list_type.from_arrays(offsets, pa.array(values), mask=mask)
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=index)
+
+
+def list_types_mapper(arrow_type: pa.DataType):
+    """
+    Types mapper for `pyarrow.Table.to_pandas` keeping list columns Arrow-backed.
+    Without it, every cell becomes an own NumPy array.
+    """
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def is_list_column(column: pd.Series) -> bool:
+    """Whether the column is an Arrow list column."""
+    return isinstance(column.dtype, pd.ArrowDtype) and list_types_mapper(column.dtype.pyarrow_dtype) is not None
+
+
+def _flatten_list_column(column: pd.Series, dtype) -> (np.ndarray, np.ndarray):
+    """Zero-copy access to the values and offsets buffers of an Arrow list column."""
+    chunked = column.array.__arrow_array__()
+    array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+    offsets = array.offsets.to_numpy().astype(np.int64)
+    # use the sliced child array instead of flatten(), so the values stay aligned to the offsets for null runs
+    values = array.values.slice(offsets[0], offsets[-1] - offsets[0]).to_numpy(zero_copy_only=False)
+    return np.asarray(values, dtype=dtype), offsets - offsets[0]
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import scipy.stats as st
+
+__all__ = ["block_design", "rank_blocks", "friedman_tests", "average_ranks", "nemenyi_tests", "friedman_nemenyi"]
+
+
+def block_design(df: pd.DataFrame, y_col: str, axes: dict) -> np.ndarray:
+    """
+    Pivots the values of `y_col` into an array with one axis per entry of `axes`, e.g.
+    {'Function': functions, 'Instance': instances, 'Algorithm': algorithms} for an array of blocked designs
+    (tests x blocks x groups) as used by the rank tests below.
+
+    :param df: Dataframe with one row per combination of the axis columns.
+    :param y_col: Column with the values.
+    :param axes: Dict mapping the axis columns to their levels (in order).
+    :return: Array with the values.
+    """
+    index = pd.MultiIndex.from_product(list(axes.values()), names=list(axes))
+    series = df.set_index(list(axes))[y_col]
+    if series.index.duplicated().any():
+        raise ValueError(f"Several values of '{y_col}' for {series.index[series.index.duplicated()][0]}.")
+    values = series.reindex(index)
+    if values.isna().any():
+        raise ValueError(f"Missing value of '{y_col}' for {values.index[values.isna()][0]}.")
+    return values.to_numpy(dtype=np.float64).reshape([len(levels) for levels in axes.values()])
+
+
+def rank_blocks(values: np.ndarray) -> np.ndarray:
+    """Ranks (1 to k, average ranks for ties) of the k groups within every block, i.e. along the last axis."""
+    return st.rankdata(values, axis=-1, method='average')
+
+
+def friedman_tests(values: np.ndarray, ranks: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    Friedman tests of all blocked designs at once, like `scipy.stats.friedmanchisquare` (including the tie correction).
+
+    :param values: Array (tests x blocks x groups), or (blocks x groups) for a single test.
+    :param ranks: Ranks of the values within the blocks, if already computed (see `rank_blocks`).
+    :return: Friedman statistics and p-values (one per test).
+    """
+    ranks = rank_blocks(values) if ranks is None else ranks
+    n, k = values.shape[-2:]
+    rank_sums = ranks.sum(axis=-2)
+    statistic = 12.0 / (n * k * (k + 1)) * (rank_sums ** 2).sum(axis=-1) - 3.0 * n * (k + 1)
+
+    # tie correction: sum of t^3 - t over the groups of t tied values = sum of t^2 - 1 over the values
+    tie_sizes = (values[..., :, None] == values[..., None, :]).sum(axis=-1)
+    ties = (tie_sizes ** 2 - 1).sum(axis=(-2, -1))
+    statistic = statistic / (1.0 - ties / (k * (k * k - 1) * n))
+    return statistic, st.chi2.sf(statistic, k - 1)
+
+
+def average_ranks(values: np.ndarray, ranks: np.ndarray = None, pct: bool = True) -> np.ndarray:
+    """
+    Average rank of every group over the blocks; with `pct` of the percentile ranks (rank / k), like
+    `groupby(block).rank(pct=True).groupby(group).mean()`.
+
+    :return: Array (tests x groups).
+    """
+    ranks = rank_blocks(values) if ranks is None else ranks
+    mean_ranks = ranks.mean(axis=-2)
+    return mean_ranks / values.shape[-1] if pct else mean_ranks
+
+
+def nemenyi_tests(values: np.ndarray, ranks: np.ndarray = None) -> np.ndarray:
+    """
+    Nemenyi post hoc tests of all blocked designs at once, like `scikit_posthocs.posthoc_nemenyi_friedman`.
+
+    :return: Array (tests x groups x groups) of the p-values of the pairwise comparisons.
+    """
+    ranks = rank_blocks(values) if ranks is None else ranks
+    n, k = values.shape[-2:]
+    mean_ranks = ranks.mean(axis=-2)
+    upper = np.triu_indices(k, 1)
+    q_values = np.abs(mean_ranks[..., upper[0]] - mean_ranks[..., upper[1]]) / np.sqrt(k * (k + 1.0) / (6.0 * n))
+
+    p_values = np.ones(values.shape[:-2] + (k, k))
+    p_values[..., upper[0], upper[1]] = st.studentized_range.sf(q_values * np.sqrt(2.0), k, np.inf)
+    p_values[..., upper[1], upper[0]] = p_values[..., upper[0], upper[1]]
+    return p_values
+
+
+def friedman_nemenyi(values: np.ndarray) -> dict:
+    """
+    Friedman test, average percentile ranks and Nemenyi post hoc test of all blocked designs in one pass over the
+    ranks.
+
+    :param values: Array (tests x blocks x groups).
+    :return: Dict with arrays 'statistic', 'pvalue' (tests), 'average_ranks' (tests x groups) and 'nemenyi'
+        (tests x groups x groups).
+    """
+    ranks = rank_blocks(values)
+    statistic, pvalue = friedman_tests(values, ranks)
+    return {
+        'statistic': statistic,
+        'pvalue': pvalue,
+        'average_ranks': average_ranks(values, ranks),
+        'nemenyi': nemenyi_tests(values, ranks)
+    }
@@ -1,9 +1,24 @@
+import json
 from pathlib import Path
 from typing import Union
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 
 import cbor2 as cb
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import feather, fs
+
+from utils.accumulators import StepAccumulator
+from utils.manifest import files_fingerprint
+from utils.ragged import list_types_mapper
+
+__all__ = ["read_log", "read_log_and_name", "read_log_columns", "read_log_columns_and_name",
+           "read_log_dir_columns_with_joblib", "read_log_files_columns_with_joblib", "accumulate_log_files_with_joblib",
+           "read_dataframe", "write_dataframe", "df_to_table", "partition_columns", "write_dataset", "load_dataset",
+           "dataset_fingerprint", "table_to_df", "read_log_dir", "read_log_dir_with_joblib",
+           "read_partial_logs_with_joblib"]
 
 
 def read_log(file_path: Union[Path, str]) -> pd.DataFrame:
@@ -29,6 +44,363 @@ def read_log_and_name(file_path: Union[Path, str]) -> (pd.DataFrame, str):
     return frame, file_name
 
 
+def read_log_columns(file_path: Union[Path, str], fields: dict) -> dict:
+    """
+    Read only the logged `fields` of the log file in `file_path` into typed NumPy arrays.
+    The entries are decoded one by one from the file and only the values of `fields` are kept,
+    so neither the whole log nor a dataframe of it is built in memory.
+
+    :param file_path: Path of the .cbor log file.
+    :param fields: Dict mapping the logged names (e.g. 'mahf::state::common::Evaluations') to the dtype of their array.
+    :return: Dict mapping the logged names to arrays with one value per entry. Entries without a value are NaN
+        (integer arrays are converted to float in this case).
+    :raises ValueError: If a field is not among the logged names.
+    """
+    file_path = Path(file_path)
+    with file_path.open('rb') as fp:
+        decoder = cb.CBORDecoder(fp)
+        major, length = _read_header(decoder)
+        assert major == 5, f'Cannot read {file_path}: log is not a CBOR map!'
+
+        names, columns = None, None
+        for item in _items(decoder, length):
+            key = decoder.decode() if length is not None else _decode_key(decoder, item)
+            if key == 'names':
+                names = decoder.decode()
+            elif key == 'entries' and names is not None:
+                columns = _read_entries(decoder, _field_indices(names, fields, file_path), fields)
+            elif key == 'entries':
+                # names are stored after the entries, so the entries have to be decoded completely
+                columns = decoder.decode()
+            else:
+                decoder.decode()
+
+    if isinstance(columns, list):
+        columns = _select_entries(columns, _field_indices(names, fields, file_path), fields)
+    return columns
+
+
+def read_log_columns_and_name(file_path: Union[Path, str], fields: dict) -> (dict, str):
+    """Read the logged `fields` of the log file in `file_path`, returning also the file name."""
+    return read_log_columns(file_path, fields), Path(file_path).stem
+
+
+def read_log_dir_columns_with_joblib(dir_path: Union[Path, str], fields: dict, n_jobs=-1):
+    """
+    Read the logged `fields` of all log files in `dir_path` in parallel using joblib and return them as dict of
+    dicts of arrays (see `read_log_columns`).
+    """
+    return read_log_files_columns_with_joblib(Path(dir_path).glob("*.cbor"), fields, n_jobs)
+
+
+def read_log_files_columns_with_joblib(file_paths, fields: dict, n_jobs=-1):
+    """
+    Read the logged `fields` of the log files in `file_paths` in parallel using joblib and return them as dict of
+    dicts of arrays (see `read_log_columns`).
+    """
+    columns = Parallel(n_jobs=n_jobs)(
+        delayed(read_log_columns_and_name)(file, fields) for file in file_paths
+    )
+    return {name: log for log, name in columns}
+
+
+def accumulate_log_files_with_joblib(file_paths, fields: dict, value_fields: list, group, step_field: str = None,
+                                     transform=None, n_jobs=-1, relative_accuracy: float = 0.01,
+                                     grid: np.ndarray = None) -> dict:
+    """
+    Accumulate per-step statistics of the logged `value_fields` per group of runs while reading the log files in
+    parallel. Every worker reads its share of the logs one at a time into its own accumulators (see
+    `utils.StepAccumulator`), which are merged at the end, so the trajectories of all runs are never in memory.
+
+    :param file_paths: Paths of the .cbor log files.
+    :param fields: Logged fields to read (see `read_log_columns`).
+    :param value_fields: Fields to accumulate (read or added by `transform`).
+    :param group: Function mapping the file name of a log to the group of the run, e.g. its function and instance.
+    :param step_field: Field with the step numbers (e.g. evaluations), kept for the longest run of every group.
+    :param transform: Optional function (file name, columns) -> columns applied to the columns of every log before
+        accumulating them, e.g. `functools.partial(utils.log_distance_to_optimum, optima=optima)`.
+    :param n_jobs: Number of workers.
+    :param relative_accuracy: Relative accuracy of the estimated medians.
+    :param grid: Optional common grid of steps (see `utils.step_grid`) to align the runs to by their `step_field`,
+        like `utils.summarise_process_stats_levels` does for runs with differing steps; without it, the runs are
+        accumulated by entry (see `utils.StepAccumulator`).
+    :return: Dict mapping the groups to dicts mapping the value fields to their accumulators.
+    """
+    file_paths = list(file_paths)
+    n_batches = max(min(len(file_paths), effective_n_jobs(n_jobs)), 1)
+    partial = Parallel(n_jobs=n_jobs)(
+        delayed(_accumulate_log_files)(file_paths[i::n_batches], fields, value_fields, group, step_field, transform,
+                                       relative_accuracy, grid)
+        for i in range(n_batches)
+    )
+    accumulators = {}
+    for worker_accumulators in partial:
+        for key, group_accumulators in worker_accumulators.items():
+            if key not in accumulators:
+                accumulators[key] = group_accumulators
+                continue
+            for field, accumulator in group_accumulators.items():
+                accumulators[key][field].merge(accumulator)
+    return accumulators
+
+
+def _accumulate_log_files(file_paths, fields: dict, value_fields: list, group, step_field: str = None,
+                          transform=None, relative_accuracy: float = 0.01, grid: np.ndarray = None) -> dict:
+    """Accumulate the logs in `file_paths` one at a time (see `accumulate_log_files_with_joblib`)."""
+    assert grid is None or step_field is not None, 'Aligning runs to a grid requires the step field!'
+    accumulators = {}
+    for file in file_paths:
+        columns, name = read_log_columns_and_name(file, fields)
+        if transform is not None:
+            columns = transform(name, columns)
+        group_accumulators = accumulators.setdefault(
+            group(name), {field: StepAccumulator(relative_accuracy, grid=grid) for field in value_fields})
+        for field in value_fields:
+            group_accumulators[field].add(columns[field], columns[step_field] if step_field else None)
+    return accumulators
+
+
+def _read_header(decoder: cb.CBORDecoder, initial_byte: int = None) -> (int, int):
+    """Read the header of the next CBOR item, returning its major type and its argument (None if indefinite)."""
+    if initial_byte is None:
+        initial_byte = decoder.read(1)[0]
+    major, info = initial_byte >> 5, initial_byte & 31
+    if info < 24:
+        return major, info
+    if info == 31:
+        return major, None
+    return major, int.from_bytes(decoder.read(1 << (info - 24)), 'big')
+
+
+def _items(decoder: cb.CBORDecoder, length: int):
+    """
+    Iterate over the items of an array or map with `length` items.
+    If the length is indefinite, iterate until the break marker and yield the already read initial byte of each item.
+    """
+    if length is not None:
+        yield from range(length)
+        return
+    while (initial_byte := decoder.read(1)[0]) != 0xff:
+        yield initial_byte
+
+
+def _decode_key(decoder: cb.CBORDecoder, initial_byte: int):
+    """Decode an integer or text key whose initial byte has already been read."""
+    major, argument = _read_header(decoder, initial_byte)
+    if major == 0:
+        return argument
+    if major == 1:
+        return -1 - argument
+    if major == 3 and argument is not None:
+        return decoder.read(argument).decode()
+    raise ValueError(f'Cannot read log: unsupported key of major type {major}!')
+
+
+def _field_indices(names, fields: dict, file_path: Path) -> dict:
+    """
+    Map the keys used in the entries to the names of the requested fields; raises an error if any field is not
+    logged in the log file in `file_path`.
+    """
+    keys = names.items() if isinstance(names, dict) else enumerate(names or [])
+    indices = {key: name for key, name in keys if name in fields}
+    missing = [name for name in fields if name not in indices.values()]
+    if missing:
+        raise ValueError(f"Field(s) {', '.join(map(repr, missing))} not logged in {file_path}.")
+    return indices
+
+
+def _read_entries(decoder: cb.CBORDecoder, indices: dict, fields: dict) -> dict:
+    """
+    Decode the entries array one entry at a time, keeping only the values of `fields` at their keys in `indices`
+    (see `_field_indices`).
+    """
+    values = {name: [] for name in fields}
+    major, length = _read_header(decoder)
+    assert major == 4, 'Cannot read log: entries are not a CBOR array!'
+
+    for item in _items(decoder, length):
+        if length is not None:
+            entry = decoder.decode()
+        else:
+            # the initial byte of the entry is already consumed, so the map is decoded pair by pair
+            _, entry_length = _read_header(decoder, item)
+            entry = {}
+            for pair in _items(decoder, entry_length):
+                key = decoder.decode() if entry_length is not None else _decode_key(decoder, pair)
+                entry[key] = decoder.decode()
+        _append_entry(entry, indices, values)
+    return _to_arrays(values, fields)
+
+
+def _select_entries(entries: list, indices: dict, fields: dict) -> dict:
+    """Keep only the values of `fields` (at their keys in `indices`) from completely decoded entries."""
+    values = {name: [] for name in fields}
+    for entry in entries:
+        _append_entry(entry, indices, values)
+    return _to_arrays(values, fields)
+
+
+def _append_entry(entry: dict, indices: dict, values: dict):
+    """Append the values of the requested fields in `entry` (None if missing)."""
+    for key, name in indices.items():
+        values[name].append(entry.get(key))
+
+
+def _to_arrays(values: dict, fields: dict) -> dict:
+    """Convert the collected values of each field into a typed array; missing values become NaN."""
+    arrays = {}
+    for name, dtype in fields.items():
+        if None in values[name]:
+            dtype = np.result_type(dtype, np.float64)
+        arrays[name] = np.array(values[name], dtype=dtype)
+    return arrays
+
+
+def read_dataframe(file_path: Union[Path, str]) -> pd.DataFrame:
+    """
+    Read a dataframe from the feather file in `file_path`.
+    Trajectory columns stay Arrow list columns, so no Python objects are created per run or value.
+    """
+    table = feather.read_table(file_path, memory_map=True)
+    return table_to_df(table)
+
+
+def write_dataframe(df: pd.DataFrame, file_path: Union[Path, str], compression: str = None):
+    """
+    Write the dataframe as feather file to `file_path`, readable both by `read_dataframe` and by `pd.read_feather`
+    (see `df_to_table`).
+
+    :param df: Dataframe to write, without index.
+    :param file_path: Path of the feather file.
+    :param compression: Compression of the file, e.g. 'uncompressed'; defaults to the default of pyarrow.
+    """
+    feather.write_feather(df_to_table(df), file_path, compression=compression)
+
+
+# Columns by which the converted runs are partitioned on disk
+partition_columns = ['Algorithm', 'Dimension', 'Function']
+
+
+def write_dataset(df: pd.DataFrame, root: Union[Path, str], partitioning=None):
+    """
+    Write the dataframe as hive-partitioned Parquet dataset to `root`, e.g. `root/Algorithm=PSO/Dimension=d10/
+    Function=f001/part-0.parquet`. Partitions contained in `df` are replaced, all others are kept.
+
+    :param df: Dataframe to write.
+    :param root: Root directory of the dataset.
+    :param partitioning: Columns to partition by, defaults to `partition_columns`.
+    """
+    if partitioning is None:
+        partitioning = partition_columns
+    table = df_to_table(df)
+    # partition keys are stored in the directory names, i.e. as plain strings
+    schema = pa.schema([pa.field(field.name, pa.string()) if field.name in partitioning else field
+                        for field in table.schema], metadata=table.schema.metadata)
+    ds.write_dataset(table.cast(schema), root, format='parquet', partitioning=partitioning,
+                     partitioning_flavor='hive', existing_data_behavior='delete_matching',
+                     basename_template='part-{i}.parquet')
+
+
+def load_dataset(root: Union[Path, str], filters: dict = None, columns: list = None,
+                 format: str = 'parquet') -> pd.DataFrame:
+    """
+    Load (a slice of) the hive-partitioned dataset in `root`.
+    Filters on partition columns only read the matching partitions; other filters are pushed down to the Parquet
+    row groups. Trajectory columns stay Arrow list columns (see `read_dataframe`).
+
+    :param root: Root directory of the dataset.
+    :param filters: Dict mapping columns to a value or a list of values to keep, e.g. {'Function': 'f001'}.
+    :param columns: Columns to load, defaults to all.
+    :param format: 'parquet' or 'ipc' (Arrow IPC files are memory-mapped).
+    :return: Dataframe with the selected rows and columns.
+    """
+    filesystem = fs.LocalFileSystem(use_mmap=format == 'ipc')
+    dataset = _open_dataset(root, filters, format, filesystem)
+    expression = _filter_expression(filters)
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table_to_df(table)
+
+    # restore the column order and categorical partition keys of the written dataframe
+    pandas_metadata = json.loads((dataset.schema.metadata or {}).get(b'pandas', b'{"columns": []}'))
+    order = [column['name'] for column in pandas_metadata['columns'] if column['name'] in df]
+    categorical = [column['name'] for column in pandas_metadata['columns']
+                   if column['pandas_type'] == 'categorical' and column['name'] in df]
+    return df[order + [col for col in df if col not in order]].astype({col: 'category' for col in categorical})
+
+
+def dataset_fingerprint(root: Union[Path, str], filters: dict = None, format: str = 'parquet') -> str:
+    """
+    Fingerprint of (a slice of) the hive-partitioned dataset in `root`, computed from the paths, sizes and
+    modification times of the files of the selected partitions. Every rewrite of a partition changes it, while the
+    files themselves are not read.
+
+    :param root: Root directory of the dataset.
+    :param filters: Dict mapping partition columns to a value or a list of values to keep (see `load_dataset`).
+    :param format: 'parquet' or 'ipc'.
+    :return: Hex digest of the selected files.
+    """
+    dataset = _open_dataset(root, filters, format)
+    return files_fingerprint(dataset.files, root)
+
+
+def _open_dataset(root: Union[Path, str], filters: dict = None, format: str = 'parquet',
+                  filesystem: fs.FileSystem = None) -> ds.Dataset:
+    """
+    Hive-partitioned dataset in `root`, restricted to the files of the partitions selected by `filters`.
+    Discovering a dataset takes the schema of its first file only, which lacks the columns of other partitions
+    (e.g. the parameters of other algorithms), so the schema is unified over the selected files instead.
+    """
+    dataset = ds.dataset(root, format=format, partitioning='hive', filesystem=filesystem)
+    fragments = list(dataset.get_fragments(filter=_filter_expression(filters)))
+    if not fragments:
+        return ds.dataset([], schema=dataset.schema, format=format, filesystem=filesystem)
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [dataset.partitioning.schema])
+    return ds.dataset([fragment.path for fragment in fragments], schema=schema, format=format,
+                      partitioning=dataset.partitioning, partition_base_dir=str(root), filesystem=filesystem)
+
+
+def _filter_expression(filters: dict = None):
+    """Dataset filter expression keeping the rows whose columns have one of the given values (None: all rows)."""
+    expression = None
+    for col, value in (filters or {}).items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        condition = ds.field(col).isin(values)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def df_to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert a dataframe (without index) to an Arrow table for writing. pandas stores the dtype names of Arrow-backed
+    list columns (e.g. 'list<item: double>[pyarrow]') in the pandas metadata of the table, which plain pandas cannot
+    parse when reading the file again; these columns are stored as object columns instead, so e.g. `pd.read_feather`
+    and `pd.read_parquet` read them as columns of arrays (and `table_to_df` as list columns).
+    """
+    return _object_list_columns(pa.Table.from_pandas(df, preserve_index=False))
+
+
+def table_to_df(table: pa.Table) -> pd.DataFrame:
+    """Convert an Arrow table to a dataframe, keeping list columns Arrow-backed."""
+    # files written without `df_to_table` may store names of ArrowDtypes that pandas cannot parse; the types mapper
+    # determines these dtypes anyway
+    return _object_list_columns(table).to_pandas(types_mapper=list_types_mapper)
+
+
+def _object_list_columns(table: pa.Table) -> pa.Table:
+    """
+    The table with the columns of ArrowDtypes (e.g. 'list<item: double>[pyarrow]') stored as object columns in its
+    pandas metadata, as pandas cannot parse the names of these dtypes.
+    """
+    metadata = table.schema.metadata or {}
+    if b'pandas' not in metadata:
+        return table
+    pandas_metadata = json.loads(metadata[b'pandas'])
+    for column in pandas_metadata['columns']:
+        if column['numpy_type'].endswith('[pyarrow]'):
+            column['numpy_type'] = 'object'
+    return table.replace_schema_metadata({**metadata, b'pandas': json.dumps(pandas_metadata).encode()})
+
+
 def read_log_dir(dir_path: Union[Path, str]):
     """Read all log files in `dir_path`, convert them to dataframes and return them as dict."""
     dir_path = Path(dir_path)